@@ -18,6 +18,12 @@ setup(
     install_requires=[
         'paho-mqtt==1.5.1'
     ],
+    entry_points={
+        'console_scripts': ['homieclient=homieclient.cli:main']
+    },
+    extras_require={
+        'parquet': ['pyarrow']
+    },
     classifiers=[
         "License :: OSI Approved :: MIT License",
         "Programming Language :: Python :: 3",
@@ -1,8 +1,11 @@
 import threading
-import paho.mqtt.client as mqtt
+import time
 
 from .device import Device
+from .export import ColumnarSink, ParquetWriter
 from .node import Node
+from .snapshot import Snapshot
+from .transport import Transport, PahoTransport, MemoryBroker, MemoryTransport
 
 
 class HomieClient:
@@ -17,7 +20,13 @@ class HomieClient:
         self,
         prefix="homie",
         server="127.0.0.1",
-        port=1883
+        port=1883,
+        lazy=False,
+        wanted_nodes=None,
+        snapshots=False,
+        resync_timeout=10,
+        devices=None,
+        transport=None
     ):
         """Initializes the client class.
 
@@ -28,27 +37,73 @@ class HomieClient:
         prefix -- the discovery prefix on the MQTT server (default "homie")
         server -- the server address (default "127.0.0.1")
         port -- the tcp port (default 1883)
+        lazy -- only create nodes when they are accessed, or when a
+                callback for nodes or properties is interested in them
+                (default False)
+        wanted_nodes -- in lazy mode, a function that is called with a
+                        device id and node id, and returns True if the
+                        node should be created as soon as it is complete.
+                        If not given, all nodes are created when a
+                        callback for nodes or properties is set
+                        (default None)
+        snapshots -- maintain immutable snapshots of the devices, see
+                     snapshot() (default False)
+        resync_timeout -- maximum number of seconds after a reconnect
+                          during which replayed retained messages are
+                          compared to the known state (default 10)
+        devices -- only subscribe to the devices with these ids
+                   (default None, i.e., all devices)
+        transport -- the Transport used to connect to the broker, which
+                     can be shared with other clients (default a
+                     PahoTransport for server and port, which is
+                     created when it is first used)
         """
         self.prefix = prefix
         self.server = server
         self.port = port
-        self.client = mqtt.Client()
-        self.client.on_connect = self.on_connect
-        self.client.on_message = self.on_message
+        self.lazy = lazy
+        self.wanted_nodes = wanted_nodes
+        self.resync_timeout = resync_timeout
+        self.connected = False
+        self.resync_stats = {
+            "resyncs": 0,
+            "last_duration": None,
+            "suppressed": 0
+        }
+        self.subscribed_devices = devices
+        self._channel = None
+        if transport is not None:
+            self._attach(transport)
+        self._was_connected = False
+        self._resync_started = None
+        self._resync_last_message = None
+        self._resync_timer = None
+        self._resync_lock = threading.Lock()
         self._complete_devices = {}
         self._incomplete_devices = {}
         self._callback_mutex = threading.RLock()
+        self._snapshot_lock = threading.Lock()
+        self._snapshot = Snapshot() if snapshots else None
+        self._derived = None
         self._on_device_discovered = None
         self._on_device_updated = None
         self._on_node_discovered = None
         self._on_node_updated = None
         self._on_property_discovered = None
         self._on_property_updated = None
+        self._on_derived_updated = None
+        self._on_broadcast = None
+        self._on_connected = None
+        self._on_disconnected = None
 
     def __getattr__(self, name):
-        """Get a device based on its id."""
+        """Get a device based on its id, or the virtual node containing
+        the derived properties as derived, unless a device has that
+        id."""
         if name in self._complete_devices:
             return self._complete_devices[name]
+        elif name == 'derived':
+            return self._get_derived()
         else:
             raise AttributeError('No such attribute: ' + name)
 
@@ -81,6 +136,7 @@ class HomieClient:
     def on_node_discovered(self, func):
         with self._callback_mutex:
             self._on_node_discovered = func
+            self._create_wanted_nodes()
 
     @property
     def on_node_updated(self):
@@ -91,6 +147,7 @@ class HomieClient:
     def on_node_updated(self, func):
         with self._callback_mutex:
             self._on_node_updated = func
+            self._create_wanted_nodes()
 
     @property
     def on_property_discovered(self):
@@ -101,6 +158,7 @@ class HomieClient:
     def on_property_discovered(self, func):
         with self._callback_mutex:
             self._on_property_discovered = func
+            self._create_wanted_nodes()
 
     @property
     def on_property_updated(self):
@@ -111,43 +169,296 @@ class HomieClient:
     def on_property_updated(self, func):
         with self._callback_mutex:
             self._on_property_updated = func
+            self._create_wanted_nodes()
+
+    @property
+    def on_derived_updated(self):
+        """Sets the function that is called when a derived property is
+        updated. The function is passed the id of the derived property,
+        and a dict containing its name, value and unit."""
+        return self._on_derived_updated
+
+    @on_derived_updated.setter
+    def on_derived_updated(self, func):
+        with self._callback_mutex:
+            self._on_derived_updated = func
+
+    @property
+    def on_broadcast(self):
+        """Sets the function that is called when a broadcast message is
+        received."""
+        return self._on_broadcast
+
+    @on_broadcast.setter
+    def on_broadcast(self, func):
+        with self._callback_mutex:
+            self._on_broadcast = func
+
+    @property
+    def on_connected(self):
+        """Sets the function that is called when the connection to the
+        broker is established. The function is passed True if this is a
+        reconnect, in which case the known state is resynchronized."""
+        return self._on_connected
+
+    @on_connected.setter
+    def on_connected(self, func):
+        with self._callback_mutex:
+            self._on_connected = func
+
+    @property
+    def on_disconnected(self):
+        """Sets the function that is called when the connection to the
+        broker is lost or refused. The function is passed the result
+        code of the disconnect, which is 0 if disconnect() was called,
+        or the result code of the refused connection."""
+        return self._on_disconnected
+
+    @on_disconnected.setter
+    def on_disconnected(self, func):
+        with self._callback_mutex:
+            self._on_disconnected = func
 
     @property
     def devices(self):
         """Returns a list of all devices that have been discovered."""
         return list(self._complete_devices.values())
 
+    def snapshot(self):
+        """Returns an immutable snapshot of all discovered devices.
+
+        The snapshot is a consistent view of the devices at one point in
+        time, and can be read from any thread without locking. Taking a
+        snapshot is cheap, as a new snapshot is created whenever the
+        devices are updated. Two snapshots can be compared with
+        Snapshot.diff(). Returns None if the client was not created
+        with snapshots enabled. In lazy mode, nodes are only included
+        after they have been accessed.
+        """
+        return self._snapshot
+
+    def _snapshot_device(self, device):
+        """Update the snapshot with the attributes of the device."""
+        if self._snapshot is not None:
+            with self._snapshot_lock:
+                self._snapshot = self._snapshot.with_device(device)
+
+    def _snapshot_node(self, node):
+        """Update the snapshot with the attributes and properties of
+        the node."""
+        if self._snapshot is not None:
+            with self._snapshot_lock:
+                self._snapshot = self._snapshot.with_node(node)
+
+    def _snapshot_property(self, node, property):
+        """Update the snapshot with the value of the property."""
+        if self._snapshot is not None:
+            with self._snapshot_lock:
+                self._snapshot = self._snapshot.with_property(node, property)
+
+    def _get_derived(self):
+        """Return the virtual node containing the derived properties,
+        see DerivedNode. It is created when it is first used."""
+        if self._derived is None:
+            from .derived import DerivedNode
+
+            with self._callback_mutex:
+                if self._derived is None:
+                    self._derived = DerivedNode(self)
+        return self._derived
+
+    @property
+    def transport(self):
+        """The transport used to connect to the broker.
+
+        The default PahoTransport is only created when it is first
+        used, so creating a client does not import paho.
+        """
+        return self._get_channel().transport
+
+    def _attach(self, transport):
+        """Attach the handlers of this client to the transport."""
+        self._channel = transport.attach(
+            self.on_connect, self.on_disconnect, self.on_message)
+
+    def _get_channel(self):
+        """Return the channel of this client on its transport, creating
+        the default transport if needed."""
+        if self._channel is None:
+            self._attach(PahoTransport(self.server, self.port))
+        return self._channel
+
     def connect(self):
         """Connect to the MQTT broker."""
-        self.client.connect_async(self.server, self.port)
-        self.client.loop_start()
+        self._get_channel().connect()
 
     def disconnect(self):
         """Disconnect from the MQTT broker."""
-        self.client.disconnect()
+        if self._channel is not None:
+            self._channel.disconnect()
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        """Publish a message on the given topic, relative to the
+        prefix."""
+        self._get_channel().publish(
+            f'{self.prefix}/{topic}', payload, qos=qos, retain=retain)
 
     def on_connect(self, client, userdata, flags, rc):
         """Handler which is called after the broker connection is
-        established."""
-        client.subscribe(f'{self.prefix}/#')
+        established.
+
+        On a reconnect, the broker replays all retained messages. These
+        are compared to the known state until the replay is finished,
+        and only messages that contain changes are processed. If the
+        broker refused the connection, i.e. the result code is not 0,
+        the disconnected callback is invoked with the result code.
+        """
+        if rc:
+            self.connected = False
+            with self._callback_mutex:
+                if self.on_disconnected:
+                    self.on_disconnected(rc)
+            return
+
+        resync = self._was_connected
+        self.connected = True
+        self._was_connected = True
+        if resync:
+            with self._resync_lock:
+                self._resync_started = time.monotonic()
+                self._resync_last_message = self._resync_started
+                self.resync_stats['resyncs'] += 1
+                self._resync_timer = threading.Timer(
+                    self.resync_timeout, self._resync_expired)
+                self._resync_timer.daemon = True
+                self._resync_timer.start()
+
+        if self.subscribed_devices is None:
+            client.subscribe(f'{self.prefix}/#')
+        else:
+            for device in self.subscribed_devices:
+                client.subscribe(f'{self.prefix}/{device}/#')
+            client.subscribe(f'{self.prefix}/$broadcast/#')
+
+        with self._callback_mutex:
+            if self.on_connected:
+                self.on_connected(resync)
+
+    def on_disconnect(self, client, userdata, rc):
+        """Handler which is called when the broker connection is
+        closed or lost."""
+        self.connected = False
+        with self._resync_lock:
+            if self._resync_started is not None:
+                self._end_resync()
+
+        with self._callback_mutex:
+            if self.on_disconnected:
+                self.on_disconnected(rc)
 
     def on_message(self, client, userdata, msg):
         """Handler for processing MQTT messages.
 
         Here, messages are passed to the corresponding device (if known)
-        or added to a list of incomplete devices.
+        or added to a list of incomplete devices. Broadcast messages are
+        passed to the broadcast callback. Retained messages replayed by
+        the broker that do not change the known state are dropped, e.g.
+        while resynchronizing after a reconnect, or when another client
+        on the same transport subscribes.
         """
         (_, device, device_topic) = msg.topic.split('/', 2)
         payload = msg.payload.decode('utf-8')
 
+        if self._resync_started is not None:
+            self._check_resync(msg)
+
+        if msg.retain and self._is_replayed(device, device_topic, payload):
+            return
+
         if device in self._complete_devices:
             self._complete_devices[device].on_message(device_topic, payload)
+        elif device == '$broadcast':
+            with self._callback_mutex:
+                if self.on_broadcast:
+                    self.on_broadcast(device_topic, payload)
         else:
             if device not in self._incomplete_devices:
                 self._incomplete_devices[device] = {}
             self._incomplete_devices[device][device_topic] = payload
             self.check_incomplete_device(device)
 
+    def _check_resync(self, msg):
+        """End the resync with the first message that is not retained,
+        as the broker only sets the retain flag on messages that are
+        replayed on subscription, or when the resync timeout expires."""
+        now = time.monotonic()
+        with self._resync_lock:
+            if self._resync_started is None:
+                return
+            elif not msg.retain or now - self._resync_started > self.resync_timeout:
+                self._end_resync()
+            else:
+                self._resync_last_message = now
+
+    def _resync_expired(self):
+        """Called from a timer thread to end the resync when the resync
+        timeout expires, even if no further messages are received."""
+        with self._resync_lock:
+            if self._resync_started is not None and \
+                    time.monotonic() - self._resync_started >= self.resync_timeout:
+                self._end_resync()
+
+    def _is_replayed(self, device, device_topic, payload):
+        """Check if a retained message is a replay of the known
+        state."""
+        if device in self._complete_devices:
+            known = self._complete_devices[device]._stored_payload(device_topic)
+        elif device in self._incomplete_devices:
+            known = self._incomplete_devices[device].get(device_topic)
+        else:
+            known = None
+
+        if known is not None and known == payload:
+            if self._resync_started is not None:
+                self.resync_stats['suppressed'] += 1
+            return True
+        return False
+
+    def _end_resync(self):
+        """Stop comparing messages to the known state and record the
+        duration of the resync. Must be called with the resync lock
+        held."""
+        self._resync_timer.cancel()
+        self.resync_stats['last_duration'] = \
+            self._resync_last_message - self._resync_started
+        self._resync_started = None
+
+    def _wants_node(self, device_id, node_id):
+        """True if the given node should be created as soon as it is
+        complete, even in lazy mode, because a derived property or a
+        callback is interested in it."""
+        if self._derived is not None and \
+                self._derived._wants_node(device_id, node_id):
+            return True
+        elif self.wanted_nodes is not None:
+            return bool(self.wanted_nodes(device_id, node_id))
+        else:
+            return bool(
+                self._on_node_discovered or self._on_node_updated or
+                self._on_property_discovered or self._on_property_updated
+            )
+
+    def _create_wanted_nodes(self):
+        """Create the nodes that are kept in lazy mode, but that a
+        callback is interested in after it has been set."""
+        if not self.lazy:
+            return
+
+        for device in list(self._complete_devices.values()):
+            for node_id in list(device._lazy_nodes.keys()):
+                if self._wants_node(device.id, node_id):
+                    device._materialize_node(node_id)
+
     def check_incomplete_device(self, device_name):
         """Check if the given device is complete.
 
@@ -160,7 +471,7 @@ class HomieClient:
 
         if '$homie' in device_data and '$name' in device_data and \
                 '$state' in device_data and '$nodes' in device_data:
-            device = Device(self, device_name)
+            device = Device(self, device_name, lazy=self.lazy)
             self._complete_devices[device_name] = device
 
             for topic in ['$name', '$homie', '$state', '$nodes']:
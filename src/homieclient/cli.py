@@ -0,0 +1,106 @@
+import argparse
+import json
+import sys
+import time
+
+from . import HomieClient
+from .transport import MemoryBroker, MemoryTransport
+
+
+def main(argv=None):
+    """Entry point of the homieclient command.
+
+    Supports the following commands:
+    dump -- print all devices found within a timeout as JSON
+    watch -- print all property updates until interrupted
+    replay -- feed a file of messages to a client and print the
+              resulting devices as JSON
+    """
+    parser = argparse.ArgumentParser(
+        prog='homieclient',
+        description='Interact with Homie IoT devices via MQTT')
+    parser.add_argument('--prefix', default='homie',
+                        help='the discovery prefix (default "homie")')
+    commands = parser.add_subparsers(dest='command')
+
+    dump = commands.add_parser('dump', help='print all devices as JSON')
+    add_broker_arguments(dump)
+    dump.add_argument('--timeout', type=float, default=5,
+                      help='seconds to wait for devices (default 5)')
+
+    watch = commands.add_parser('watch', help='print all property updates')
+    add_broker_arguments(watch)
+
+    replay = commands.add_parser(
+        'replay', help='replay a file of messages and print all devices as JSON')
+    replay.add_argument('file', type=argparse.FileType('r'),
+                        help='file with a "topic payload" line per message')
+
+    args = parser.parse_args(argv)
+    if args.command is None:
+        parser.error('a command is required')
+
+    if args.command == 'dump':
+        c = HomieClient(prefix=args.prefix, server=args.server, port=args.port,
+                        snapshots=True)
+        c.connect()
+        time.sleep(args.timeout)
+        c.disconnect()
+        print_snapshot(c.snapshot())
+
+    elif args.command == 'watch':
+        c = HomieClient(prefix=args.prefix, server=args.server, port=args.port)
+        c.on_property_updated = print_property
+        c.connect()
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            c.disconnect()
+
+    elif args.command == 'replay':
+        broker = MemoryBroker()
+        c = HomieClient(prefix=args.prefix, transport=MemoryTransport(broker),
+                        snapshots=True)
+        c.connect()
+        with args.file as f:
+            for line in f:
+                if line.strip():
+                    (topic, _, payload) = line.strip().partition(' ')
+                    broker.publish(topic, payload.strip(), retain=True)
+        print_snapshot(c.snapshot())
+
+
+def add_broker_arguments(parser):
+    """Add the arguments to connect to the broker to the parser."""
+    parser.add_argument('--server', default='127.0.0.1',
+                        help='the server address (default "127.0.0.1")')
+    parser.add_argument('--port', type=int, default=1883,
+                        help='the tcp port (default 1883)')
+
+
+def print_property(node, property, value):
+    """Print a property update on a single line."""
+    unit = ' ' + value['unit'] if value['unit'] else ''
+    print(f"{node.device.id}/{node.id}/{property} {value['value']}{unit}",
+          flush=True)
+
+
+def print_snapshot(snapshot):
+    """Print all devices in the snapshot as JSON."""
+    devices = {
+        device.id: {
+            "attributes": dict(device.attributes),
+            "stats": dict(device.stats),
+            "nodes": {
+                node.id: {
+                    "attributes": dict(node.attributes),
+                    "properties": {
+                        id: dict(value) for id, value in node.properties.items()
+                    }
+                } for node in device.nodes.values()
+            }
+        } for device in snapshot
+    }
+    json.dump(devices, sys.stdout, indent=2, ensure_ascii=False)
+    print()
@@ -0,0 +1,237 @@
+import heapq
+from collections import deque
+
+
+class DerivedNode:
+    """A virtual node containing properties derived from other
+    properties.
+
+    A derived property is computed from one or more input properties,
+    which are given as paths of the form device/node/property, or as
+    the id of another derived property. Whenever an input is updated,
+    only the derived properties that depend on it are computed again,
+    in the order in which they were defined, and the derived update
+    callback of the client is invoked. An exception raised while
+    computing a property, or by the callback, is logged and does not
+    reach the thread processing the MQTT messages; the value of the
+    property is then None.
+
+    The derived properties can be accessed as properties of this node,
+    just like the properties of an ordinary node. This node does not
+    belong to a device.
+    """
+    def __init__(self, homie_client, id='derived'):
+        """Create a new, empty, derived node.
+
+        Arguments:
+        homie_client -- the Homie client parent class
+
+        Keyword arguments:
+        id -- the id of this node (default "derived")
+        """
+        self._homie_client = homie_client
+        self.id = id
+        self.attributes = {'$name': 'Derived properties', '$type': 'derived'}
+        self._complete_properties = {}
+        self._property_values = {}
+        self._computations = {}
+        self._order = {}
+        self._dependents = {}
+        self._nodes = set()
+
+    def __getattr__(self, name):
+        """Get a derived property or an attribute of this node, based on
+        its id or name, omitting the initial $."""
+        if name in self._complete_properties:
+            return self._get_property(name)
+        elif '$' + name in self.attributes:
+            return self.attributes['$' + name]
+        else:
+            raise AttributeError('No such attribute: ' + name)
+
+    @property
+    def properties(self):
+        """Return a list of all the derived properties."""
+        return list(self._complete_properties.keys())
+
+    def define(self, id, func, inputs, name=None, unit=None, datatype='float'):
+        """Define a property computed from other properties.
+
+        The function is called with the values of the inputs, in the
+        given order, whenever one of them is updated. It is only called
+        once all inputs have a value. Example:
+
+        define('net_power', lambda delivered, returned: delivered - returned,
+               ['powermeter/powermeter/power_delivered',
+                'powermeter/powermeter/power_returned'], unit='W')
+
+        Arguments:
+        id -- the id of the derived property
+        func -- the function computing the value
+        inputs -- the paths or ids of the input properties
+
+        Keyword arguments:
+        name -- the name of the property (default the id)
+        unit -- the unit of the property (default None)
+        datatype -- the datatype of the property (default "float")
+        """
+        inputs = [self._input_key(i) for i in inputs]
+
+        def compute():
+            values = [self._property_values.get(i) for i in inputs]
+            if None in values:
+                return None
+            return func(*values)
+
+        self._add(id, compute, inputs, name, unit, datatype)
+
+    def define_window(self, id, input, size, aggregate, name=None, unit=None,
+                      datatype='float'):
+        """Define a property aggregating the last values of a property.
+
+        The aggregate function is called with a list of at most size of
+        the most recent values of the input, whenever the input is
+        updated, e.g. define_window('avg', 'sensor/dht/temperature', 10,
+        statistics.mean).
+
+        Arguments:
+        id -- the id of the derived property
+        input -- the path or id of the input property
+        size -- the number of values to aggregate
+        aggregate -- the function computing the value
+
+        Keyword arguments:
+        name -- the name of the property (default the id)
+        unit -- the unit of the property (default None)
+        datatype -- the datatype of the property (default "float")
+        """
+        input = self._input_key(input)
+        window = deque(maxlen=size)
+
+        def compute():
+            value = self._property_values.get(input)
+            if value is None:
+                return self._property_values.get(id)
+            window.append(value)
+            return aggregate(list(window))
+
+        self._add(id, compute, [input], name, unit, datatype)
+
+    def _input_key(self, path):
+        """Return the key of the given input, i.e. a (device, node,
+        property) tuple or the id of a derived property."""
+        if '/' not in path:
+            if path not in self._complete_properties:
+                raise ValueError('No such derived property: ' + path)
+            return path
+
+        key = tuple(path.split('/'))
+        if len(key) != 3 or not all(key):
+            raise ValueError(
+                'Invalid input, expected device/node/property: ' + path)
+        return key
+
+    def _add(self, id, compute, inputs, name, unit, datatype):
+        """Add a derived property, and compute its value from the
+        current values of its inputs."""
+        if id in self._complete_properties:
+            raise ValueError('Derived property already defined: ' + id)
+
+        with self._homie_client._callback_mutex:
+            self._complete_properties[id] = {
+                '$name': name if name is not None else id,
+                '$datatype': datatype,
+                '$unit': unit
+            }
+            self._computations[id] = compute
+            self._order[id] = len(self._order)
+            for i in inputs:
+                self._dependents.setdefault(i, []).append(id)
+                if isinstance(i, tuple):
+                    self._nodes.add(i[:2])
+                    self._property_values[i] = self._current_value(i)
+
+            self._recompute([id])
+
+    def _current_value(self, key):
+        """Return the current value of the given input property, or
+        None if it is not known (yet)."""
+        (device, node, property) = key
+        try:
+            node = getattr(getattr(self._homie_client, device), node)
+            return getattr(node, property)['value']
+        except AttributeError:
+            return None
+
+    def _wants_node(self, device_id, node_id):
+        """True if a derived property depends on the given node."""
+        return (device_id, node_id) in self._nodes
+
+    def _on_input(self, node, property):
+        """Called whenever a property of an ordinary node is updated.
+
+        Like for ordinary properties, the callback is only invoked if
+        the device of the updated input is ready.
+        """
+        if not self._dependents:
+            return
+
+        key = (node.device.id, node.id, property)
+        if key in self._dependents:
+            with self._homie_client._callback_mutex:
+                self._property_values[key] = node._get_property(property)['value']
+                self._recompute(self._dependents[key], node.device.is_ready())
+
+    def _recompute(self, ids, notify=True):
+        """Compute the given derived properties and all properties that
+        depend on them, and, if notify is True, invoke the callback for
+        every property that has a value.
+
+        A derived property can only depend on properties that were
+        defined before it, so computing them in the order of definition
+        ensures all inputs are up to date.
+        """
+        pending = [(self._order[id], id) for id in ids]
+        heapq.heapify(pending)
+        computed = set()
+
+        while pending:
+            (_, id) = heapq.heappop(pending)
+            if id in computed:
+                continue
+            computed.add(id)
+
+            try:
+                value = self._computations[id]()
+            except Exception:
+                log_exception('Error computing derived property %s', id)
+                value = None
+
+            self._property_values[id] = value
+            for dependent in self._dependents.get(id, []):
+                heapq.heappush(pending, (self._order[dependent], dependent))
+
+            if notify and value is not None and \
+                    self._homie_client.on_derived_updated:
+                try:
+                    self._homie_client.on_derived_updated(
+                        id, self._get_property(id))
+                except Exception:
+                    log_exception(
+                        'Error in callback for derived property %s', id)
+
+    def _get_property(self, property):
+        """Format the value of the derived property as a dict containing
+        the name, value and unit of the property."""
+        return {
+            "name": self._complete_properties[property]['$name'],
+            "value": self._property_values.get(property),
+            "unit": self._complete_properties[property]['$unit']
+        }
+
+
+def log_exception(message, *args):
+    """Log the exception that is being handled. The logging module is
+    only imported when needed, as importing it is relatively slow."""
+    import logging
+    logging.getLogger(__name__).exception(message, *args)
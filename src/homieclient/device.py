@@ -1,30 +1,61 @@
+import sys
+
 from .node import Node
 
 
+STAT_TYPES = {
+    'uptime': int,
+    'signal': int,
+    'cputemp': float,
+    'cpuload': int,
+    'battery': int,
+    'freeheap': int,
+    'supply': float,
+    'interval': int
+}
+
+
 class Device:
     """Represents a Homie device and contains its nodes.
 
     The nodes and attributes on this device can be accessed as
     properties based on their id or name (omitting the initial $).
+    Statistics published under $stats are available, converted to
+    their proper type, in the stats dict, and the extensions announced
+    in $extensions are available in the extensions dict.
+
+    In lazy mode, complete nodes are kept as raw topic to payload tables
+    and only turned into Node objects when they are accessed, or when
+    the client has a callback that is interested in them.
     """
-    def __init__(self, homie_client, id):
+    def __init__(self, homie_client, id, lazy=False):
         """Create a new device with the given id.
 
         Arguments:
         homie_client -- the Homie client parent class
         id -- the id of this device as found on the network
+
+        Keyword arguments:
+        lazy -- only create nodes when they are needed (default False)
         """
         self._homie_client = homie_client
         self.id = id
+        self._lazy = lazy
         self.attributes = {}
+        self.stats = {}
+        self._stat_payloads = {}
+        self.extensions = {}
         self._complete_nodes = {}
         self._incomplete_nodes = {}
+        self._lazy_nodes = {}
 
     def __getattr__(self, name):
         """Get a node or an attribute of this device, based on its id or
         name, omitting the initial $."""
         if name in self._complete_nodes:
             return self._complete_nodes[name]
+        elif name in self._lazy_nodes:
+            return self._materialize_node(name)
         elif '$' + name in self.attributes:
             return self.attributes['$' + name]
         else:
@@ -33,6 +64,8 @@ class Device:
     @property
     def nodes(self):
         """Return a list of all the nodes in this device."""
+        for name in list(self._lazy_nodes.keys()):
+            self._materialize_node(name)
         return list(self._complete_nodes.values())
 
     def is_ready(self):
@@ -47,13 +80,22 @@ class Device:
             if len(payload.strip()):
                 nodes = payload.split(',')
                 for n in nodes:
-                    if n not in self._complete_nodes and n not in self._incomplete_nodes:
+                    if n not in self._complete_nodes and n not in self._incomplete_nodes \
+                            and n not in self._lazy_nodes:
                         self._incomplete_nodes[n] = {}
             else:
                 self._incomplete_nodes = {}
 
         elif topic[0] == '$':
-            self.attributes[topic] = payload
+            if topic.startswith('$stats/'):
+                self._stat_payloads[topic] = payload
+                payload = self._parse_stat(topic[7:], payload)
+            else:
+                self.attributes[topic] = payload
+                if topic == '$extensions':
+                    self._parse_extensions(payload)
+
+            self._homie_client._snapshot_device(self)
 
             with self._homie_client._callback_mutex:
                 if not len(self._incomplete_nodes) and self._homie_client.on_device_updated:
@@ -61,39 +103,147 @@ class Device:
 
         else:
             (node, node_topic) = topic.split('/', 1)
-
-            if node in self._complete_nodes:
-                self._complete_nodes[node].on_message(node_topic, payload)
-
+            complete_node = self._complete_nodes.get(node)
+
+            if complete_node is None and self._lazy:
+                # Another thread can materialize the node at any time, so
+                # check both tables again while holding the lock.
+                with self._homie_client._callback_mutex:
+                    data = self._lazy_nodes.get(node)
+                    if data is not None:
+                        data[sys.intern(node_topic)] = payload
+                        return
+                    complete_node = self._complete_nodes.get(node)
+
+            if complete_node is not None:
+                complete_node.on_message(node_topic, payload)
             else:
                 self._incomplete_nodes[node][node_topic] = payload
                 self.check_incomplete_nodes(node)
 
+    def _stored_payload(self, topic):
+        """Return the last payload received for the given topic, or
+        None if it is unknown or not stored as is."""
+        if topic == '$nodes':
+            return None
+        elif topic.startswith('$stats/'):
+            return self._stat_payloads.get(topic)
+        elif topic[0] == '$':
+            return self.attributes.get(topic)
+
+        (node, node_topic) = topic.split('/', 1)
+        if node in self._complete_nodes:
+            return self._complete_nodes[node]._stored_payload(node_topic)
+
+        data = self._lazy_nodes.get(node, self._incomplete_nodes.get(node))
+        return data.get(node_topic) if data is not None else None
+
     def check_incomplete_nodes(self, node_name):
         """Check if the given node is complete.
 
         After every message, this method is invoked to check if all
         required data is known for a node. If so, the node is complete,
         and it can be added to the list of complete nodes, and the
-        callback is invoked to inform the user.
+        callback is invoked to inform the user. In lazy mode, the node
+        is only created if the client wants to know about it, otherwise
+        its data is kept until the node is accessed.
         """
         data = self._incomplete_nodes[node_name]
 
         if '$name' in data and '$type' in data and '$properties' in data:
-            node = Node(self._homie_client, self, node_name)
-            self._complete_nodes[node_name] = node
+            if self._lazy and not self._homie_client._wants_node(self.id, node_name):
+                self._lazy_nodes[node_name] = {
+                    sys.intern(topic): payload for topic, payload in data.items()
+                }
+            else:
+                self._create_node(node_name, data)
 
-            for topic in ['$name', '$type', '$properties']:
-                node.on_message(topic, data[topic])
-                del data[topic]
+            del self._incomplete_nodes[node_name]
 
-            node._initializing = False
+    def _materialize_node(self, node_name):
+        """Create the node with the given name from its raw data.
 
-            for topic, payload in data.items():
-                node.on_message(topic, payload)
+        Used in lazy mode, returns the newly created node.
+        The raw data is only removed after the node has been added to
+        the list of complete nodes, so messages for this node that
+        arrive in the meantime wait for the lock, and are then passed
+        to the node instead of being overwritten by the stored data.
+        """
+        with self._homie_client._callback_mutex:
+            data = self._lazy_nodes.get(node_name)
+            if data is None:
+                return self._complete_nodes[node_name]
+            node = self._create_node(node_name, data)
+            del self._lazy_nodes[node_name]
+            return node
+
+    def _create_node(self, node_name, data):
+        """Create a node from the given topics and payloads.
+
+        The node is added to the list of complete nodes, and to the
+        snapshot, once all data has been passed to it, and the callback
+        is invoked to inform the user.
+        """
+        node = Node(self._homie_client, self, node_name)
 
-            with self._homie_client._callback_mutex:
-                if self._homie_client.on_node_discovered:
-                    self._homie_client.on_node_discovered(node)
+        for topic in ['$name', '$type', '$properties']:
+            node.on_message(topic, data[topic])
+            del data[topic]
 
-            del self._incomplete_nodes[node_name]
+        node._initializing = False
+
+        for topic, payload in data.items():
+            node.on_message(topic, payload)
+
+        self._complete_nodes[node_name] = node
+        node._registered = True
+        self._homie_client._snapshot_node(node)
+
+        with self._homie_client._callback_mutex:
+            if self._homie_client.on_node_discovered:
+                self._homie_client.on_node_discovered(node)
+
+        return node
+
+    def _parse_stat(self, stat, payload):
+        """Convert the value of the given statistic and store it.
+
+        Known statistics are converted to their type as defined by the
+        Homie convention, unknown statistics are converted to a number
+        if possible. Returns the converted value, or None if the value
+        is invalid.
+        """
+        stat_type = STAT_TYPES.get(stat)
+        try:
+            if stat_type:
+                value = stat_type(payload)
+            else:
+                try:
+                    value = int(payload)
+                except ValueError:
+                    value = float(payload)
+        except ValueError:
+            value = None if stat_type else payload
+
+        self.stats[stat] = value
+        return value
+
+    def _parse_extensions(self, payload):
+        """Parse the list of extensions announced by the device.
+
+        Every extension is formatted as id:version:[homie versions], and
+        is stored in the extensions dict as a dict containing the
+        version of the extension and the list of supported Homie
+        versions.
+        """
+        self.extensions = {}
+        for extension in payload.split(','):
+            parts = extension.strip().split(':')
+            if not parts[0]:
+                continue
+            version = parts[1] if len(parts) > 1 else None
+            homie = parts[2].strip('[]').split(';') if len(parts) > 2 else []
+            self.extensions[parts[0]] = {
+                "version": version,
+                "homie": homie
+            }
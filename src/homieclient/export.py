@@ -0,0 +1,260 @@
+import queue
+import threading
+import time
+
+
+VALUE_COLUMNS = {
+    'integer': 'integer',
+    'float': 'float',
+    'boolean': 'boolean'
+}
+
+
+class RowGroup:
+    """A batch of property updates, stored per column.
+
+    The device, node and property columns contain codes into the
+    dictionaries of the sink. Every row has a value in exactly one of
+    the value columns (integer, float, boolean or string), depending on
+    the datatype of the property; the other value columns are None.
+    """
+    def __init__(self):
+        self.timestamp = []
+        self.device = []
+        self.node = []
+        self.property = []
+        self.integer = []
+        self.float = []
+        self.boolean = []
+        self.string = []
+
+    def __len__(self):
+        return len(self.timestamp)
+
+    def append(self, timestamp, device, node, property, column, value):
+        """Add a row containing the value in the given value column."""
+        self.timestamp.append(timestamp)
+        self.device.append(device)
+        self.node.append(node)
+        self.property.append(property)
+        self.integer.append(value if column == 'integer' else None)
+        self.float.append(value if column == 'float' else None)
+        self.boolean.append(value if column == 'boolean' else None)
+        self.string.append(value if column == 'string' else None)
+
+
+class ColumnarSink:
+    """Streams property updates to a columnar file.
+
+    Property updates are collected in row groups, which are handed to a
+    writer on a background thread when they reach the configured size,
+    or when the flush interval has passed. Device, node and property ids
+    are dictionary encoded. At most max_pending row groups are waiting
+    to be written; if the writer cannot keep up, further row groups are
+    dropped and counted in dropped_rows, so the MQTT thread is never
+    blocked. Updates received after the sink has been closed are dropped
+    and counted as well.
+
+    Use on_property_updated as (or call it from) the property update
+    callback of the client.
+    """
+    def __init__(
+        self,
+        writer,
+        row_group_size=10000,
+        flush_interval=60,
+        max_pending=4
+    ):
+        """Create a new sink and start its writer thread.
+
+        Arguments:
+        writer -- object with write_row_group(row_group, dictionaries)
+                  and close() methods, e.g. a ParquetWriter
+
+        Keyword arguments:
+        row_group_size -- number of rows per row group (default 10000)
+        flush_interval -- maximum number of seconds before a row group
+                          is written (default 60)
+        max_pending -- maximum number of row groups waiting to be
+                       written (default 4)
+        """
+        self.writer = writer
+        self.row_group_size = row_group_size
+        self.flush_interval = flush_interval
+        self.dropped_rows = 0
+        self._closed = False
+        self._dictionaries = {'device': [], 'node': [], 'property': []}
+        self._codes = {'device': {}, 'node': {}, 'property': {}}
+        self._row_group = RowGroup()
+        self._row_group_started = time.monotonic()
+        self._lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._error = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def on_property_updated(self, node, property, value):
+        """Add a property update to the current row group."""
+        datatype = node._complete_properties[property]['$datatype']
+        column = VALUE_COLUMNS.get(datatype, 'string')
+
+        with self._lock:
+            if self._closed:
+                self.dropped_rows += 1
+                return
+            self._row_group.append(
+                time.time(),
+                self._encode('device', node.device.id),
+                self._encode('node', node.id),
+                self._encode('property', property),
+                column,
+                value['value']
+            )
+            if len(self._row_group) >= self.row_group_size:
+                self._flush()
+
+    def close(self):
+        """Write the remaining updates and close the writer.
+
+        Waits until the writer thread has room for the last row group,
+        so it is never dropped, and until all row groups are written.
+        Any error raised by the writer on the background thread is
+        raised here. Closing the sink again has no effect.
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            item = self._take_row_group()
+        if item is not None:
+            self._queue.put(item)
+        self._queue.put(None)
+        self._thread.join()
+        self.writer.close()
+        if self._error is not None:
+            raise self._error
+
+    def _encode(self, column, id):
+        """Return the dictionary code for the given id, adding it to
+        the dictionary if needed. Must be called with the lock held."""
+        codes = self._codes[column]
+        code = codes.get(id)
+        if code is None:
+            code = len(codes)
+            codes[id] = code
+            self._dictionaries[column].append(id)
+        return code
+
+    def _take_row_group(self):
+        """Start a new row group, and return the current one together
+        with the dictionaries, or None if it is empty. Must be called
+        with the lock held."""
+        row_group = self._row_group
+        self._row_group = RowGroup()
+        self._row_group_started = time.monotonic()
+
+        if not len(row_group):
+            return None
+
+        dictionaries = {
+            column: list(values) for column, values in self._dictionaries.items()
+        }
+        return (row_group, dictionaries)
+
+    def _flush(self):
+        """Hand the current row group to the writer thread without
+        blocking, dropping it if too many row groups are pending. Must
+        be called with the lock held."""
+        item = self._take_row_group()
+        if item is None:
+            return
+
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self.dropped_rows += len(item[0])
+
+    def _run(self):
+        """Write row groups until the sink is closed, flushing the
+        current row group when the flush interval has passed."""
+        while True:
+            timeout = self._row_group_started + self.flush_interval - time.monotonic()
+            try:
+                item = self._queue.get(timeout=max(timeout, 0))
+            except queue.Empty:
+                with self._lock:
+                    if time.monotonic() - self._row_group_started >= self.flush_interval:
+                        self._flush()
+                continue
+
+            if item is None:
+                return
+
+            if self._error is None:
+                try:
+                    self.writer.write_row_group(*item)
+                except Exception as e:
+                    self._error = e
+
+
+class ParquetWriter:
+    """Writes row groups of a ColumnarSink to a Parquet file.
+
+    Requires pyarrow, which can be installed with the parquet extra of
+    this package.
+    """
+    def __init__(self, path, compression='snappy'):
+        """Create a new Parquet file at the given path.
+
+        Arguments:
+        path -- the path of the file to create
+
+        Keyword arguments:
+        compression -- the compression codec to use (default "snappy")
+        """
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError('pyarrow is required to write Parquet files')
+
+        self._pa = pyarrow
+        ids = pyarrow.dictionary(pyarrow.int32(), pyarrow.string())
+        self.schema = pyarrow.schema([
+            ('timestamp', pyarrow.timestamp('us', tz='UTC')),
+            ('device', ids),
+            ('node', ids),
+            ('property', ids),
+            ('integer', pyarrow.int64()),
+            ('float', pyarrow.float64()),
+            ('boolean', pyarrow.bool_()),
+            ('string', pyarrow.string())
+        ])
+        self._writer = pyarrow.parquet.ParquetWriter(
+            path, self.schema, compression=compression)
+
+    def write_row_group(self, row_group, dictionaries):
+        """Write the row group to the file."""
+        pa = self._pa
+
+        def ids(column):
+            return pa.DictionaryArray.from_arrays(
+                pa.array(getattr(row_group, column), pa.int32()),
+                pa.array(dictionaries[column], pa.string()))
+
+        table = pa.Table.from_arrays([
+            pa.array([int(t * 1000000) for t in row_group.timestamp],
+                     self.schema.field('timestamp').type),
+            ids('device'),
+            ids('node'),
+            ids('property'),
+            pa.array(row_group.integer, pa.int64()),
+            pa.array(row_group.float, pa.float64()),
+            pa.array(row_group.boolean, pa.bool_()),
+            pa.array(row_group.string, pa.string())
+        ], schema=self.schema)
+        self._writer.write_table(table)
+
+    def close(self):
+        """Close the file."""
+        self._writer.close()
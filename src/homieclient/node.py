@@ -22,6 +22,7 @@ class Node:
         self._incomplete_properties = {}
         self._property_values = {}
         self._initializing = True
+        self._registered = False
 
     def __getattr__(self, name):
         """Get a property or an attribute of this node, based on its id
@@ -39,6 +40,27 @@ class Node:
         """Return a list of all the properties on this node."""
         return list(self._complete_properties.keys())
 
+    def set(self, property, value):
+        """Request the device to set the given property to a new
+        value.
+
+        The value is published to the set topic of the property. Note
+        that the property is only updated when the device publishes the
+        new value.
+        """
+        if property not in self._complete_properties:
+            raise AttributeError('No such property: ' + property)
+
+        if value is True:
+            payload = 'true'
+        elif value is False:
+            payload = 'false'
+        else:
+            payload = str(value)
+
+        self._homie_client.publish(
+            f'{self.device.id}/{self.id}/{property}/set', payload, qos=1)
+
     def on_message(self, topic, payload):
         """Callback to process MQTT messages and either update the
         relevant property or the attributes of the node."""
@@ -51,6 +73,9 @@ class Node:
         elif topic[0] == '$':
             self.attributes[topic] = payload
 
+            if self._registered:
+                self._homie_client._snapshot_node(self)
+
             with self._homie_client._callback_mutex:
                 if not self._initializing and self._homie_client.on_node_updated:
                     self._homie_client.on_node_updated(self, topic, payload)
@@ -60,6 +85,8 @@ class Node:
 
             if property in self._complete_properties:
                 self._complete_properties[property][topic] = payload
+                if self._registered:
+                    self._homie_client._snapshot_property(self, property)
 
             else:
                 self._incomplete_properties[property][topic] = payload
@@ -70,6 +97,21 @@ class Node:
             if topic in self._complete_properties:
                 self._property_updated(topic)
 
+    def _stored_payload(self, topic):
+        """Return the last payload received for the given topic, or
+        None if it is unknown or not stored as is."""
+        if topic == '$properties':
+            return None
+        elif topic[0] == '$':
+            return self.attributes.get(topic)
+        elif '/' in topic:
+            (property, topic) = topic.split('/', 1)
+            data = self._complete_properties.get(
+                property, self._incomplete_properties.get(property))
+            return data.get(topic) if data is not None else None
+        else:
+            return self._property_values.get(topic)
+
     def check_incomplete_properties(self, property):
         """Check if the given property is complete.
 
@@ -84,6 +126,9 @@ class Node:
             self._complete_properties[property] = data
             del self._incomplete_properties[property]
 
+            if self._registered:
+                self._homie_client._snapshot_node(self)
+
             with self._homie_client._callback_mutex:
                 if self._homie_client.on_property_discovered:
                     self._homie_client.on_property_discovered(self, property)
@@ -96,19 +141,28 @@ class Node:
 
         If the device is ready, calls the property update callback. This
         avoids property updates being sent when the device is offline.
+        The snapshot is only updated once the node has been registered
+        by its device, which then adds the node as a whole.
         """
+        if self._registered:
+            self._homie_client._snapshot_property(self, property)
+
         with self._homie_client._callback_mutex:
             if self.device.is_ready() and  \
                     self._homie_client.on_property_updated:
                 self._homie_client.on_property_updated(
                     self, property, self._get_property(property))
 
+        derived = self._homie_client._derived
+        if derived is not None:
+            derived._on_input(self, property)
+
     def _get_property(self, property):
         """Format the value of the property as a dict.
 
         Returns a dict containing the name, value and unit of the
         property.  The value is converted based on the datatype for the
-        property.
+        property, and is None if it is not valid for the datatype.
         """
         datatype = self._complete_properties[property]['$datatype']
         unit = self._complete_properties[property].get('$unit')
@@ -117,9 +171,15 @@ class Node:
 
         if raw_value is not None:
             if datatype == 'integer':
-                value = int(raw_value)
+                try:
+                    value = int(raw_value)
+                except ValueError:
+                    value = None
             elif datatype == 'float':
-                value = float(raw_value)
+                try:
+                    value = float(raw_value)
+                except ValueError:
+                    value = None
             elif datatype == 'boolean':
                 if raw_value == 'true':
                     value = True
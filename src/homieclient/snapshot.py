@@ -0,0 +1,323 @@
+from collections import namedtuple
+from collections.abc import Mapping
+from types import MappingProxyType
+
+
+EMPTY = MappingProxyType({})
+
+DeviceSnapshot = namedtuple('DeviceSnapshot', ['id', 'attributes', 'stats', 'nodes'])
+DeviceSnapshot.__doc__ = """Immutable view of a device, its attributes, stats and nodes."""
+
+NodeSnapshot = namedtuple('NodeSnapshot', ['id', 'attributes', 'properties'])
+NodeSnapshot.__doc__ = """Immutable view of a node, its attributes and properties."""
+
+
+def freeze(d):
+    """Return a read-only copy of the given dict."""
+    return MappingProxyType(dict(d))
+
+
+BITS = 5
+WIDTH = 1 << BITS
+MASK = WIDTH - 1
+HASH_BITS = 64
+
+
+class _Leaf:
+    """A single key and value in a PersistentMap."""
+    __slots__ = ('hash', 'key', 'value')
+
+    def __init__(self, hash, key, value):
+        self.hash = hash
+        self.key = key
+        self.value = value
+
+
+class _Collision:
+    """The keys and values in a PersistentMap that have the same hash."""
+    __slots__ = ('hash', 'items')
+
+    def __init__(self, hash, items):
+        self.hash = hash
+        self.items = items
+
+
+class PersistentMap(Mapping):
+    """An immutable mapping that can be updated cheaply.
+
+    The items are stored in a hash array mapped trie with 32 slots per
+    level. set() returns a new map, which only copies the levels on the
+    path to the changed key, and shares everything else with this map.
+    Updating a key therefore costs O(log n), instead of O(n) for copying
+    a dict.
+    """
+    __slots__ = ('_root', '_len')
+
+    def __init__(self, items=()):
+        """Create a new map containing the given (key, value) pairs."""
+        self._root = (None,) * WIDTH
+        self._len = 0
+        for (key, value) in dict(items).items():
+            (self._root, added) = _set(self._root, 0, _hash(key), key, value)
+            self._len += added
+
+    def __getitem__(self, key):
+        h = _hash(key)
+        slot = self._root
+        shift = 0
+        while type(slot) is tuple:
+            slot = slot[(h >> shift) & MASK]
+            shift += BITS
+
+        if type(slot) is _Leaf:
+            if slot.hash == h and slot.key == key:
+                return slot.value
+        elif type(slot) is _Collision and slot.hash == h:
+            for (k, v) in slot.items:
+                if k == key:
+                    return v
+        raise KeyError(key)
+
+    def __iter__(self):
+        for (key, _) in _items(self._root):
+            yield key
+
+    def __len__(self):
+        return self._len
+
+    def set(self, key, value):
+        """Return a new map with the key set to the value."""
+        (root, added) = _set(self._root, 0, _hash(key), key, value)
+        m = PersistentMap.__new__(PersistentMap)
+        m._root = root
+        m._len = self._len + added
+        return m
+
+    def changed_keys(self, other):
+        """Return the keys that may have a different value in the other
+        map. Parts of the maps that are shared are skipped, so this is
+        cheap for maps derived from each other with a few updates."""
+        keys = []
+        _changed_keys(self._root, other._root, keys)
+        return keys
+
+
+def _hash(key):
+    return hash(key) & ((1 << HASH_BITS) - 1)
+
+
+def _set(node, shift, h, key, value):
+    """Set the key in the given trie node. Returns the new node and
+    whether a key was added."""
+    i = (h >> shift) & MASK
+    slot = node[i]
+    added = True
+
+    if slot is None:
+        new = _Leaf(h, key, value)
+    elif type(slot) is tuple:
+        (new, added) = _set(slot, shift + BITS, h, key, value)
+    elif slot.hash != h:
+        new = _set(_split(slot, shift + BITS), shift + BITS, h, key, value)[0]
+    elif type(slot) is _Leaf:
+        if slot.key == key:
+            new = _Leaf(h, key, value)
+            added = False
+        else:
+            new = _Collision(h, ((slot.key, slot.value), (key, value)))
+    else:
+        items = tuple((k, v) for (k, v) in slot.items if k != key)
+        added = len(items) == len(slot.items)
+        new = _Collision(h, items + ((key, value),))
+
+    return (node[:i] + (new,) + node[i + 1:], added)
+
+
+def _split(slot, shift):
+    """Return a new trie node containing the leaf or collision."""
+    i = (slot.hash >> shift) & MASK
+    return (None,) * i + (slot,) + (None,) * (WIDTH - i - 1)
+
+
+def _items(slot):
+    """Iterate over the (key, value) pairs below the given slot."""
+    if slot is None:
+        return
+    elif type(slot) is tuple:
+        for s in slot:
+            yield from _items(s)
+    elif type(slot) is _Leaf:
+        yield (slot.key, slot.value)
+    else:
+        yield from slot.items
+
+
+def _changed_keys(a, b, keys):
+    """Add the keys below two slots that are not shared to keys."""
+    if a is b:
+        return
+    elif type(a) is tuple and type(b) is tuple:
+        for (x, y) in zip(a, b):
+            _changed_keys(x, y, keys)
+    else:
+        seen = set()
+        for slot in (a, b):
+            for (key, _) in _items(slot):
+                if key not in seen:
+                    seen.add(key)
+                    keys.append(key)
+
+
+EMPTY_MAP = PersistentMap()
+MISSING = object()
+
+
+class Snapshot:
+    """An immutable, versioned view of all devices known to the client.
+
+    A snapshot is never modified: every update of the device tree
+    results in a new snapshot, which shares all unchanged devices, nodes
+    and properties with the previous one. The devices are available as
+    a PersistentMap from id to DeviceSnapshot in the devices attribute,
+    so an update only copies the path to the changed device, and the
+    snapshot itself can be indexed by device id.
+
+    The values of properties are read-only dicts containing the name,
+    value and unit of the property, as returned by the nodes.
+    """
+    def __init__(self, version=0, devices=EMPTY_MAP):
+        """Create a new snapshot.
+
+        Keyword arguments:
+        version -- the version of this snapshot (default 0)
+        devices -- a PersistentMap of device id to DeviceSnapshot
+        """
+        self.version = version
+        self.devices = devices
+
+    def __getitem__(self, device_id):
+        return self.devices[device_id]
+
+    def __contains__(self, device_id):
+        return device_id in self.devices
+
+    def __len__(self):
+        return len(self.devices)
+
+    def __iter__(self):
+        return iter(self.devices.values())
+
+    def diff(self, other):
+        """Return the changes from this snapshot to the other one.
+
+        Returns a list of (path, old, new) tuples. The path is a tuple
+        of ids, ending with the attribute or property that changed,
+        e.g. ('sensor1', 'dht', 'temperature'). Stats are reported as
+        $stats/<name> attributes of the device. Added and removed
+        devices or nodes are reported as a whole, with None as old or
+        new value. Devices and nodes shared by both snapshots are
+        skipped without comparing their contents.
+        """
+        changes = []
+        _diff(self.devices, other.devices, (), changes, _diff_devices)
+        return changes
+
+    def with_device(self, device):
+        """Return a new snapshot with the attributes and stats of the
+        given device updated."""
+        old = self.devices.get(device.id)
+        return self._replace_device(DeviceSnapshot(
+            device.id,
+            freeze(device.attributes),
+            freeze(device.stats),
+            old.nodes if old is not None else EMPTY
+        ))
+
+    def with_node(self, node):
+        """Return a new snapshot with the attributes and all properties
+        of the given node updated."""
+        return self._replace_node(node.device, NodeSnapshot(
+            node.id,
+            freeze(node.attributes),
+            freeze({p: _property(node, p) for p in node._complete_properties})
+        ))
+
+    def with_property(self, node, property):
+        """Return a new snapshot with the value of a single property of
+        the given node updated."""
+        device = self.devices.get(node.device.id)
+        old = device.nodes.get(node.id) if device is not None else None
+        if old is None:
+            return self.with_node(node)
+
+        properties = dict(old.properties)
+        properties[property] = _property(node, property)
+        return self._replace_node(
+            node.device, old._replace(properties=MappingProxyType(properties)))
+
+    def _replace_node(self, device, node_snapshot):
+        """Return a new snapshot with the given node snapshot."""
+        old = self.devices.get(device.id)
+        if old is None:
+            old = DeviceSnapshot(
+                device.id, freeze(device.attributes), freeze(device.stats), EMPTY)
+
+        nodes = dict(old.nodes)
+        nodes[node_snapshot.id] = node_snapshot
+        return self._replace_device(old._replace(nodes=MappingProxyType(nodes)))
+
+    def _replace_device(self, device_snapshot):
+        """Return a new snapshot with the given device snapshot."""
+        return Snapshot(
+            self.version + 1, self.devices.set(device_snapshot.id, device_snapshot))
+
+
+def _property(node, property):
+    """Return a read-only value of the given property."""
+    return MappingProxyType(node._get_property(property))
+
+
+def _diff(old, new, path, changes, nested=None):
+    """Add the differences between two mappings to changes.
+
+    If nested is given, it is used to compare values that exist in both
+    mappings, instead of reporting them as a whole.
+    """
+    if old is new:
+        return
+
+    if isinstance(old, PersistentMap) and isinstance(new, PersistentMap):
+        keys = old.changed_keys(new)
+    else:
+        keys = list(old.keys()) + [key for key in new.keys() if key not in old]
+
+    for key in keys:
+        a = old.get(key, MISSING)
+        b = new.get(key, MISSING)
+        if a is b:
+            continue
+        elif a is MISSING:
+            changes.append((path + (key,), None, b))
+        elif b is MISSING:
+            changes.append((path + (key,), a, None))
+        elif nested is not None:
+            nested(a, b, path + (key,), changes)
+        elif a != b:
+            changes.append((path + (key,), a, b))
+
+
+def _diff_devices(old, new, path, changes):
+    """Add the differences between two device snapshots to changes."""
+    _diff(old.attributes, new.attributes, path, changes)
+    if old.stats is not new.stats:
+        _diff(
+            {'$stats/' + k: v for k, v in old.stats.items()},
+            {'$stats/' + k: v for k, v in new.stats.items()},
+            path, changes)
+    _diff(old.nodes, new.nodes, path, changes, _diff_nodes)
+
+
+def _diff_nodes(old, new, path, changes):
+    """Add the differences between two node snapshots to changes."""
+    _diff(old.attributes, new.attributes, path, changes)
+    _diff(old.properties, new.properties, path, changes)
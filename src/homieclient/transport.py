@@ -0,0 +1,344 @@
+import threading
+
+
+class Transport:
+    """Base class for the connection to an MQTT broker.
+
+    A transport can be shared by several clients. Every client attaches
+    to the transport, and gets a Channel with the same connect,
+    disconnect, subscribe and publish methods as the transport. The
+    handlers of a channel are the same as those of the paho MQTT client,
+    with the channel passed as the client:
+    on_connect(channel, userdata, flags, rc),
+    on_disconnect(channel, userdata, rc) and
+    on_message(channel, userdata, msg). The message has the topic,
+    payload (as bytes), qos and retain attributes, and is only passed to
+    the channels that subscribed to a matching topic.
+
+    Subclasses implement connect, disconnect, subscribe, unsubscribe and
+    publish, and report events with _connected, _disconnected and
+    _received.
+    """
+    def __init__(self):
+        self.connected = False
+        self._channels = ()
+        self._lock = threading.RLock()
+
+    def attach(self, on_connect=None, on_disconnect=None, on_message=None):
+        """Return a new channel on this transport with the given
+        handlers."""
+        return Channel(self, on_connect, on_disconnect, on_message)
+
+    def connect(self):
+        """Connect to the broker."""
+        raise NotImplementedError
+
+    def disconnect(self):
+        """Disconnect from the broker."""
+        raise NotImplementedError
+
+    def subscribe(self, topic):
+        """Subscribe to the given topic, which may contain wildcards."""
+        raise NotImplementedError
+
+    def unsubscribe(self, topic):
+        """Unsubscribe from the given topic."""
+        raise NotImplementedError
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        """Publish a message to the given topic."""
+        raise NotImplementedError
+
+    def _connected(self, flags, rc):
+        """Called by subclasses when a connection attempt finished."""
+        self.connected = not rc
+        for channel in self._channels:
+            channel._connected(flags, rc)
+
+    def _disconnected(self, rc):
+        """Called by subclasses when the connection is closed."""
+        self.connected = False
+        for channel in self._channels:
+            channel._disconnected(rc)
+
+    def _received(self, msg):
+        """Called by subclasses when a message is received."""
+        for channel in self._channels:
+            if channel._subscribed(msg.topic):
+                channel._received(msg)
+
+    def _set_active(self, channel, active):
+        """Add the channel to or remove it from the connected channels.
+        Returns the number of remaining channels."""
+        with self._lock:
+            channels = [c for c in self._channels if c is not channel]
+            if active:
+                channels.append(channel)
+            self._channels = tuple(channels)
+            return len(self._channels)
+
+    def _release(self, channel):
+        """Unsubscribe from the topics of the channel that no other
+        channel is subscribed to."""
+        with self._lock:
+            in_use = set()
+            for other in self._channels:
+                if other is not channel:
+                    in_use.update(other.subscriptions)
+        for topic in set(channel.subscriptions) - in_use:
+            self.unsubscribe(topic)
+
+
+class Channel:
+    """The connection of a single client to a shared Transport.
+
+    Connecting a channel connects the transport if needed. Disconnecting
+    a channel only disconnects the transport when no other channel is
+    connected, and then unsubscribes from the topics that no other
+    channel is subscribed to. The retained messages that the broker
+    replays when a channel subscribes are received by all channels with
+    a matching subscription, with the retain flag set.
+    """
+    def __init__(self, transport, on_connect, on_disconnect, on_message):
+        self.transport = transport
+        self.on_connect = on_connect
+        self.on_disconnect = on_disconnect
+        self.on_message = on_message
+        self.subscriptions = []
+
+    def connect(self):
+        """Connect to the broker, or, if the transport is already
+        connected, invoke the connect handler right away."""
+        self.transport._set_active(self, True)
+        if self.transport.connected:
+            self._connected({'session present': 1}, 0)
+        else:
+            self.transport.connect()
+
+    def disconnect(self):
+        """Disconnect this channel, and the transport if no other
+        channel is connected."""
+        if self.transport._set_active(self, False):
+            self.transport._release(self)
+        else:
+            self.transport.disconnect()
+        self.subscriptions = []
+        self._disconnected(0)
+
+    def subscribe(self, topic):
+        """Subscribe to the given topic."""
+        self.subscriptions.append(topic)
+        self.transport.subscribe(topic)
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        """Publish a message to the given topic."""
+        self.transport.publish(topic, payload, qos=qos, retain=retain)
+
+    def _subscribed(self, topic):
+        for topic_filter in self.subscriptions:
+            if topic_matches(topic_filter, topic):
+                return True
+        return False
+
+    def _connected(self, flags, rc):
+        if not rc:
+            self.subscriptions = []
+        if self.on_connect:
+            self.on_connect(self, None, flags, rc)
+
+    def _disconnected(self, rc):
+        if self.on_disconnect:
+            self.on_disconnect(self, None, rc)
+
+    def _received(self, msg):
+        if self.on_message:
+            self.on_message(self, None, msg)
+
+
+class PahoTransport(Transport):
+    """Transport using the paho MQTT client.
+
+    The paho client is available as the client attribute, e.g. to
+    configure authentication or TLS before connecting. Paho is only
+    imported when the first transport is created, to keep importing
+    this package cheap for tools that do not connect to a broker.
+    """
+    def __init__(self, server="127.0.0.1", port=1883):
+        """Create a new transport for the given broker.
+
+        Keyword arguments:
+        server -- the server address (default "127.0.0.1")
+        port -- the tcp port (default 1883)
+        """
+        import paho.mqtt.client as mqtt
+
+        super().__init__()
+        self.server = server
+        self.port = port
+        self.client = mqtt.Client()
+        self.client.on_connect = self._on_connect
+        self.client.on_disconnect = self._on_disconnect
+        self.client.on_message = self._on_message
+
+    def connect(self):
+        """Connect to the broker in the background. The connection is
+        handled by the network thread of paho, which also reconnects
+        when the connection is lost."""
+        self.client.connect_async(self.server, self.port)
+        self.client.loop_start()
+
+    def disconnect(self):
+        """Disconnect from the broker."""
+        self.client.disconnect()
+
+    def subscribe(self, topic):
+        """Subscribe to the given topic."""
+        self.client.subscribe(topic)
+
+    def unsubscribe(self, topic):
+        """Unsubscribe from the given topic."""
+        self.client.unsubscribe(topic)
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        """Publish a message to the given topic."""
+        self.client.publish(topic, payload, qos=qos, retain=retain)
+
+    def _on_connect(self, client, userdata, flags, rc):
+        self._connected(flags, rc)
+
+    def _on_disconnect(self, client, userdata, rc):
+        self._disconnected(rc)
+
+    def _on_message(self, client, userdata, msg):
+        self._received(msg)
+
+
+class Message:
+    """An MQTT message delivered by a MemoryBroker."""
+    def __init__(self, topic, payload, qos=0, retain=False):
+        self.topic = topic
+        self.payload = payload
+        self.qos = qos
+        self.retain = retain
+
+
+class MemoryBroker:
+    """A minimal MQTT broker that runs inside the current process.
+
+    Supports wildcard subscriptions and retained messages, which are
+    replayed on subscription with the retain flag set. Messages are
+    delivered synchronously, i.e., the handlers of the subscribed
+    transports are called from the thread that publishes the message.
+    Useful for tests and benchmarks, and for feeding a client with
+    messages from another source.
+    """
+    def __init__(self):
+        self.retained = {}
+        self._subscriptions = []
+        self._lock = threading.RLock()
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        """Publish a message to all transports with a matching
+        subscription. Every transport receives the message once, even if
+        several of its subscriptions match.
+
+        A retained message replaces the previous retained message on the
+        topic; a retained message with an empty payload removes it.
+        """
+        if isinstance(payload, str):
+            payload = payload.encode('utf-8')
+
+        with self._lock:
+            if retain:
+                if payload:
+                    self.retained[topic] = payload
+                else:
+                    self.retained.pop(topic, None)
+            transports = []
+            for (topic_filter, transport) in self._subscriptions:
+                if transport not in transports and topic_matches(topic_filter, topic):
+                    transports.append(transport)
+
+        for transport in transports:
+            transport._deliver(Message(topic, payload, qos))
+
+    def subscribe(self, transport, topic_filter):
+        """Subscribe the transport to the given topic filter, and
+        replay the matching retained messages."""
+        with self._lock:
+            if (topic_filter, transport) not in self._subscriptions:
+                self._subscriptions.append((topic_filter, transport))
+            retained = [
+                (topic, payload) for (topic, payload) in self.retained.items()
+                if topic_matches(topic_filter, topic)
+            ]
+
+        for (topic, payload) in retained:
+            transport._deliver(Message(topic, payload, retain=True))
+
+    def unsubscribe(self, transport, topic_filter=None):
+        """Remove the subscription of the transport to the given topic
+        filter, or all its subscriptions if no filter is given."""
+        with self._lock:
+            self._subscriptions = [
+                s for s in self._subscriptions if s[1] is not transport or
+                (topic_filter is not None and s[0] != topic_filter)
+            ]
+
+
+class MemoryTransport(Transport):
+    """Transport connecting to a MemoryBroker."""
+    def __init__(self, broker):
+        """Create a new transport for the given broker.
+
+        Arguments:
+        broker -- the MemoryBroker to connect to
+        """
+        super().__init__()
+        self.broker = broker
+
+    def connect(self):
+        """Connect to the broker."""
+        self._connected({'session present': 0}, 0)
+
+    def disconnect(self, rc=0):
+        """Disconnect from the broker. A result code other than 0 can be
+        passed to simulate a lost connection."""
+        self.broker.unsubscribe(self)
+        self._disconnected(rc)
+
+    def subscribe(self, topic):
+        """Subscribe to the given topic."""
+        self.broker.subscribe(self, topic)
+
+    def unsubscribe(self, topic):
+        """Unsubscribe from the given topic."""
+        self.broker.unsubscribe(self, topic)
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        """Publish a message to the given topic."""
+        self.broker.publish(topic, payload, qos=qos, retain=retain)
+
+    def _deliver(self, msg):
+        if self.connected:
+            self._received(msg)
+
+
+def topic_matches(topic_filter, topic):
+    """True if the topic matches the filter, which may contain the +
+    and # wildcards."""
+    if topic_filter == topic:
+        return True
+    elif topic_filter[-1] == '#' and '+' not in topic_filter:
+        return topic.startswith(topic_filter[:-1]) or topic == topic_filter[:-2]
+
+    filter_levels = topic_filter.split('/')
+    topic_levels = topic.split('/')
+    for (i, level) in enumerate(filter_levels):
+        if level == '#':
+            return True
+        elif i >= len(topic_levels):
+            return False
+        elif level != '+' and level != topic_levels[i]:
+            return False
+    return len(filter_levels) == len(topic_levels)
@@ -0,0 +1,97 @@
+import json
+import os
+import subprocess
+import sys
+import pytest
+from unittest.mock import Mock
+
+from homieclient.cli import main, print_property
+
+
+COLD_START_BUDGET = 1.0
+IMPORT_BUDGET = 0.1
+MESSAGES = os.path.join(os.path.dirname(__file__), 'messages.txt')
+
+# The start-up budgets depend on the speed of the machine, so they are
+# only checked when HOMIECLIENT_BENCHMARK is set.
+benchmark = pytest.mark.skipif(
+    not os.environ.get('HOMIECLIENT_BENCHMARK'),
+    reason='set HOMIECLIENT_BENCHMARK to check the start-up budgets')
+
+
+def test_replay(capsys):
+    main(['replay', MESSAGES])
+
+    devices = json.loads(capsys.readouterr().out)
+    assert sorted(devices.keys()) == ['powermeter', 'sensor1']
+    assert devices['sensor1']['stats']['uptime'] == 468969
+    assert devices['sensor1']['nodes']['dht']['properties']['temperature'] == {
+        'name': 'Temperature', 'unit': '°C', 'value': 19.82}
+    assert devices['powermeter']['nodes']['powermeter']['properties']['power_delivered'] == {
+        'name': 'Power delivered', 'unit': 'W', 'value': 410}
+
+
+def test_no_command():
+    with pytest.raises(SystemExit):
+        main([])
+
+
+def test_print_property(capsys):
+    node = Mock()
+    node.id = 'dht'
+    node.device.id = 'sensor1'
+
+    print_property(node, 'temperature', {'name': 'Temperature', 'value': 19.82, 'unit': '°C'})
+    print_property(node, 'count', {'name': 'Count', 'value': 3, 'unit': None})
+
+    assert capsys.readouterr().out == 'sensor1/dht/temperature 19.82 °C\nsensor1/dht/count 3\n'
+
+
+def test_import_does_not_load_paho():
+    output = subprocess.check_output([
+        sys.executable, '-c',
+        'import sys, homieclient; print("paho" in sys.modules)'
+    ])
+    assert output.strip() == b'False'
+
+
+def test_import_does_not_load_optional_modules():
+    output = subprocess.check_output([
+        sys.executable, '-c',
+        'import sys, homieclient; homieclient.HomieClient(); '
+        'print("logging" in sys.modules, "homieclient.derived" in sys.modules)'
+    ])
+    assert output.split() == [b'False', b'False']
+
+
+def test_client_does_not_load_paho():
+    output = subprocess.check_output([
+        sys.executable, '-c',
+        'import sys, homieclient; c = homieclient.HomieClient(); '
+        'print("paho" in sys.modules); c.transport; print("paho" in sys.modules)'
+    ])
+    assert output.split() == [b'False', b'True']
+
+
+@benchmark
+def test_import_time():
+    assert best_of(3, [
+        sys.executable, '-c',
+        'import time; t = time.perf_counter(); import homieclient; '
+        'print(time.perf_counter() - t)'
+    ]) < IMPORT_BUDGET
+
+
+@benchmark
+def test_cold_start_time():
+    assert best_of(3, [
+        sys.executable, '-c',
+        'import time, subprocess, sys; t = time.perf_counter(); '
+        'subprocess.check_call([sys.executable, "-m", "homieclient", "replay", '
+        f'{MESSAGES!r}], stdout=subprocess.DEVNULL); '
+        'print(time.perf_counter() - t)'
+    ]) < COLD_START_BUDGET
+
+
+def best_of(n: int, command: list) -> float:
+    return min(float(subprocess.check_output(command)) for _ in range(n))
@@ -1,5 +1,6 @@
 from unittest.mock import Mock, patch
 import pytest
+import time
 
 from homieclient import HomieClient
 from paho.mqtt.client import MQTTMessage
@@ -38,6 +39,75 @@ def test_out_of_order():
     assert c.testdevice._incomplete_nodes['testnode']['$attr'] == 'value'
 
 
+def test_broadcast():
+    c = HomieClient()
+    c.on_broadcast = Mock()
+    get_client_with_messages({
+        'homie/$broadcast/alert': 'Intruder detected'
+    }, c)
+    c.on_broadcast.assert_called_with('alert', 'Intruder detected')
+    assert len(c._incomplete_devices) == 0
+
+
+def test_lazy_client():
+    c = HomieClient(lazy=True)
+    get_client_with_messages({
+        'homie/testdevice/$homie': '3.0.1',
+        'homie/testdevice/$name': 'Test device',
+        'homie/testdevice/$state': 'ready',
+        'homie/testdevice/$nodes': 'testnode',
+        'homie/testdevice/testnode/$name': 'Test node',
+        'homie/testdevice/testnode/$type': 'test',
+        'homie/testdevice/testnode/$properties': ''
+    }, c)
+    assert 'testnode' in c.testdevice._lazy_nodes
+    assert c.testdevice.testnode.name == 'Test node'
+
+
+def test_lazy_client_with_callback():
+    c = HomieClient(lazy=True)
+    c.on_property_updated = Mock()
+    get_client_with_messages({
+        'homie/testdevice/$homie': '3.0.1',
+        'homie/testdevice/$name': 'Test device',
+        'homie/testdevice/$state': 'ready',
+        'homie/testdevice/$nodes': 'testnode',
+        'homie/testdevice/testnode/$name': 'Test node',
+        'homie/testdevice/testnode/$type': 'test',
+        'homie/testdevice/testnode/$properties': ''
+    }, c)
+    assert 'testnode' in c.testdevice._complete_nodes
+
+
+def test_lazy_client_callback_set_later():
+    c = HomieClient(lazy=True)
+    get_client_with_messages(DEVICE, c)
+    assert 'testnode' in c.testdevice._lazy_nodes
+
+    c.on_property_updated = Mock()
+    assert 'testnode' in c.testdevice._complete_nodes
+    c.on_property_updated.reset_mock()
+
+    get_client_with_messages({'homie/testdevice/testnode/prop': '2'}, c)
+    c.on_property_updated.assert_called_once_with(c.testdevice.testnode, 'prop', {
+        'name': 'Property', 'unit': None, 'value': 2})
+
+
+def test_lazy_client_wanted_nodes():
+    c = HomieClient(lazy=True, wanted_nodes=lambda device, node: device == 'wanted')
+    c.on_property_updated = Mock()
+    for device in ['wanted', 'other']:
+        get_client_with_messages({
+            topic.replace('testdevice', device): payload
+            for topic, payload in DEVICE.items()
+        }, c)
+
+    assert 'testnode' in c.wanted._complete_nodes
+    assert 'testnode' in c.other._lazy_nodes
+    c.on_property_updated.assert_called_once_with(c.wanted.testnode, 'prop', {
+        'name': 'Property', 'unit': None, 'value': 1})
+
+
 def test_subscribe_default_prefix():
     c = HomieClient()
     mqtt_client = Mock()
@@ -52,7 +122,99 @@ def test_subscribe_custom_prefix():
     mqtt_client.subscribe.assert_called_with('unittest/#')
 
 
-@patch('homieclient.mqtt.Client')
+def test_connection_callbacks():
+    c = HomieClient()
+    c.on_connected = Mock()
+    c.on_disconnected = Mock()
+    mqtt_client = Mock()
+
+    c.on_connect(mqtt_client, None, None, 0)
+    assert c.connected
+    c.on_connected.assert_called_with(False)
+
+    c.on_disconnect(mqtt_client, None, 1)
+    assert not c.connected
+    c.on_disconnected.assert_called_with(1)
+
+    c.on_connect(mqtt_client, None, None, 0)
+    c.on_connected.assert_called_with(True)
+
+
+def test_connection_refused():
+    c = HomieClient()
+    c.on_connected = Mock()
+    c.on_disconnected = Mock()
+    mqtt_client = Mock()
+
+    c.on_connect(mqtt_client, None, None, 5)
+    assert not c.connected
+    c.on_disconnected.assert_called_with(5)
+    c.on_connected.assert_not_called()
+    mqtt_client.subscribe.assert_not_called()
+
+    c.on_connect(mqtt_client, None, None, 0)
+    assert c.connected
+    c.on_connected.assert_called_with(False)
+    assert c.resync_stats['resyncs'] == 0
+
+
+def test_resync_suppresses_duplicates():
+    c = HomieClient()
+    c.on_property_updated = Mock()
+    c.on_connect(Mock(), None, None, 0)
+    get_client_with_messages(DEVICE, c, retain=True)
+    assert c.on_property_updated.call_count == 1
+
+    c.on_disconnect(None, None, 1)
+    c.on_connect(Mock(), None, None, 0)
+    changed = dict(DEVICE)
+    changed['homie/testdevice/testnode/prop'] = '2'
+    get_client_with_messages(changed, c, retain=True)
+
+    assert c.on_property_updated.call_count == 2
+    c.on_property_updated.assert_called_with(c.testdevice.testnode, 'prop', {
+        'name': 'Property', 'unit': None, 'value': 2})
+    assert c.resync_stats['resyncs'] == 1
+    assert c.resync_stats['suppressed'] == len(DEVICE) - 3
+
+    get_client_with_messages({'homie/testdevice/testnode/prop': '2'}, c)
+    assert c.resync_stats['last_duration'] is not None
+    assert c.on_property_updated.call_count == 3
+
+
+def test_no_resync_on_first_connect():
+    c = HomieClient()
+    c.on_connect(Mock(), None, None, 0)
+    get_client_with_messages(DEVICE, c, retain=True)
+    get_client_with_messages(DEVICE, c, retain=True)
+
+    assert c.resync_stats['suppressed'] == 0
+
+
+def test_resync_timeout():
+    c = HomieClient(resync_timeout=0)
+    c.on_connect(Mock(), None, None, 0)
+    get_client_with_messages(DEVICE, c, retain=True)
+    c.on_connect(Mock(), None, None, 0)
+    get_client_with_messages(DEVICE, c, retain=True)
+
+    assert c.resync_stats['suppressed'] == 0
+    assert c._resync_started is None
+
+
+def test_resync_ends_without_messages():
+    c = HomieClient(resync_timeout=0.05)
+    c.on_connect(Mock(), None, None, 0)
+    get_client_with_messages(DEVICE, c, retain=True)
+    c.on_connect(Mock(), None, None, 0)
+    get_client_with_messages(DEVICE, c, retain=True)
+    time.sleep(0.2)
+
+    assert c._resync_started is None
+    assert c.resync_stats['last_duration'] is not None
+
+
+@patch('paho.mqtt.client.Client')
 def test_connect_custom_params(mock_client_constructor):
     mock_client = Mock()
     mock_client_constructor.side_effect = [mock_client]
@@ -62,13 +224,30 @@ def test_connect_custom_params(mock_client_constructor):
     mock_client.connect_async.assert_called_with('unit-test-server', 1337)
 
 
-def get_client_with_messages(msgs: dict) -> HomieClient:
-    c = HomieClient()
+DEVICE = {
+    'homie/testdevice/$homie': '3.0.1',
+    'homie/testdevice/$name': 'Test device',
+    'homie/testdevice/$state': 'ready',
+    'homie/testdevice/$nodes': 'testnode',
+    'homie/testdevice/testnode/$name': 'Test node',
+    'homie/testdevice/testnode/$type': 'test',
+    'homie/testdevice/testnode/$properties': 'prop',
+    'homie/testdevice/testnode/prop/$name': 'Property',
+    'homie/testdevice/testnode/prop/$datatype': 'integer',
+    'homie/testdevice/testnode/prop': '1'
+}
+
+
+def get_client_with_messages(msgs: dict, c: HomieClient = None,
+                             retain: bool = False) -> HomieClient:
+    if c is None:
+        c = HomieClient()
 
     for topic, payload in msgs.items():
         msg = MQTTMessage()
         msg.topic = topic.encode('utf-8')
         msg.payload = payload.encode('utf-8')
+        msg.retain = retain
         c.on_message(None, None, msg)
 
     return c
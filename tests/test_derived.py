@@ -0,0 +1,187 @@
+import pytest
+import statistics
+from unittest.mock import Mock
+
+from homieclient import HomieClient, MemoryBroker, MemoryTransport
+
+
+def test_arithmetic():
+    (c, broker) = get_client_with_devices()
+    c.derived.define(
+        'net_power', lambda delivered, returned: delivered - returned,
+        ['room1/meter/delivered', 'room1/meter/returned'],
+        name='Net power', unit='W')
+
+    assert c.derived.net_power == {'name': 'Net power', 'unit': 'W', 'value': -1000}
+
+    broker.publish('homie/room1/meter/delivered', '1500', retain=True)
+    assert c.derived.net_power['value'] == 100
+    c.on_derived_updated.assert_called_with('net_power', {
+        'name': 'Net power', 'unit': 'W', 'value': 100})
+    c.on_property_updated.assert_called_with(
+        c.room1.meter, 'delivered', {
+            'name': 'Power delivered', 'unit': None, 'value': 1500})
+
+
+def test_missing_input():
+    (c, broker) = get_client_with_devices()
+    c.derived.define('sum', lambda a, b: a + b,
+                     ['room1/meter/delivered', 'room3/meter/delivered'])
+
+    assert c.derived.sum['value'] is None
+
+
+def test_cross_device_sum():
+    (c, broker) = get_client_with_devices()
+    c.derived.define('total', lambda *values: sum(values),
+                     ['room1/meter/delivered', 'room2/meter/delivered'])
+
+    assert c.derived.total['value'] == 1000
+    broker.publish('homie/room2/meter/delivered', '700', retain=True)
+    assert c.derived.total['value'] == 1100
+
+
+def test_window():
+    (c, broker) = get_client_with_devices()
+    c.derived.define_window('average', 'room1/meter/delivered', 3, statistics.mean)
+
+    for value in ['100', '200', '300', '400']:
+        broker.publish('homie/room1/meter/delivered', value, retain=True)
+
+    assert c.derived.average['value'] == 300
+
+
+def test_chained():
+    (c, broker) = get_client_with_devices()
+    c.derived.define('double', lambda v: v * 2, ['room1/meter/delivered'])
+    c.derived.define('plus_one', lambda v: v + 1, ['double'])
+
+    broker.publish('homie/room1/meter/delivered', '10', retain=True)
+
+    assert c.derived.double['value'] == 20
+    assert c.derived.plus_one['value'] == 21
+    assert c.derived.properties == ['double', 'plus_one']
+
+
+def test_only_affected_recomputed():
+    (c, broker) = get_client_with_devices()
+    room1 = Mock(side_effect=lambda v: v)
+    room2 = Mock(side_effect=lambda v: v)
+    c.derived.define('room1', room1, ['room1/meter/delivered'])
+    c.derived.define('room2', room2, ['room2/meter/delivered'])
+
+    broker.publish('homie/room1/meter/delivered', '10', retain=True)
+
+    assert room1.call_count == 2
+    assert room2.call_count == 1
+
+
+def test_failing_computation(caplog):
+    (c, broker) = get_client_with_devices()
+    c.derived.define('ratio', lambda a, b: a / b,
+                     ['room2/meter/delivered', 'room2/meter/returned'])
+    c.derived.define('double', lambda v: v * 2, ['ratio'])
+
+    assert c.derived.ratio['value'] is None
+    assert c.derived.double['value'] is None
+    assert 'Error computing derived property ratio' in caplog.text
+
+    broker.publish('homie/room2/meter/returned', '300', retain=True)
+    assert c.derived.ratio['value'] == 2
+    assert c.derived.double['value'] == 4
+
+
+def test_failing_callback(caplog):
+    (c, broker) = get_client_with_devices()
+    c.on_derived_updated = Mock(side_effect=AttributeError('device'))
+    c.derived.define('delivered', lambda v: v, ['room1/meter/delivered'])
+
+    broker.publish('homie/room1/meter/delivered', '500', retain=True)
+
+    assert c.derived.delivered['value'] == 500
+    assert c.on_derived_updated.call_count == 2
+    assert 'Error in callback for derived property delivered' in caplog.text
+
+
+def test_device_not_ready():
+    (c, broker) = get_client_with_devices()
+    c.derived.define('delivered', lambda v: v, ['room1/meter/delivered'])
+    c.on_derived_updated.reset_mock()
+
+    broker.publish('homie/room1/$state', 'sleeping', retain=True)
+    broker.publish('homie/room1/meter/delivered', '500', retain=True)
+
+    assert c.derived.delivered['value'] == 500
+    c.on_derived_updated.assert_not_called()
+
+
+def test_device_named_derived():
+    (c, broker) = get_client_with_devices()
+    c.derived.define('delivered', lambda v: v, ['derived/meter/delivered'])
+    publish_device(broker, 'derived', 300, 0)
+
+    assert c.derived.meter.delivered['value'] == 300
+    assert c._derived.delivered['value'] == 300
+
+
+@pytest.mark.parametrize("path", ['room1/delivered', 'room1/meter/delivered/x', 'room1//delivered'])
+def test_invalid_input_path(path):
+    c = HomieClient()
+    with pytest.raises(ValueError, match='expected device/node/property'):
+        c.derived.define('value', lambda v: v, [path])
+
+
+def test_unknown_derived_input():
+    c = HomieClient()
+    with pytest.raises(ValueError):
+        c.derived.define('plus_one', lambda v: v + 1, ['unknown'])
+
+
+def test_duplicate():
+    c = HomieClient()
+    c.derived.define('one', lambda v: v, ['room1/meter/delivered'])
+    with pytest.raises(ValueError):
+        c.derived.define('one', lambda v: v, ['room1/meter/delivered'])
+
+
+def test_lazy():
+    broker = MemoryBroker()
+    c = HomieClient(lazy=True, transport=MemoryTransport(broker))
+    c.derived.define('delivered', lambda v: v, ['room1/meter/delivered'])
+    c.connect()
+    publish_device(broker, 'room1', 400, 1400)
+    publish_device(broker, 'room2', 600, 0)
+
+    assert c.derived.delivered['value'] == 400
+    assert 'meter' in c.room1._complete_nodes
+    assert 'meter' in c.room2._lazy_nodes
+
+
+def get_client_with_devices():
+    broker = MemoryBroker()
+    publish_device(broker, 'room1', 400, 1400)
+    publish_device(broker, 'room2', 600, 0)
+    c = HomieClient(transport=MemoryTransport(broker))
+    c.connect()
+    c.on_property_updated = Mock()
+    c.on_derived_updated = Mock()
+    return (c, broker)
+
+
+def publish_device(broker: MemoryBroker, id: str, delivered: int, returned: int):
+    for topic, payload in [
+        ('$homie', '3.0.1'),
+        ('$name', id),
+        ('$state', 'ready'),
+        ('$nodes', 'meter'),
+        ('meter/$name', 'Power meter'),
+        ('meter/$type', 'meter'),
+        ('meter/$properties', 'delivered,returned'),
+        ('meter/delivered/$name', 'Power delivered'),
+        ('meter/delivered/$datatype', 'integer'),
+        ('meter/delivered', str(delivered)),
+        ('meter/returned/$name', 'Power returned'),
+        ('meter/returned/$datatype', 'integer'),
+        ('meter/returned', str(returned))
+    ]:
+        broker.publish(f'homie/{id}/{topic}', payload, retain=True)
@@ -129,8 +129,176 @@ def test_node_discovery_callback():
     d._homie_client.on_node_discovered.assert_called_with(d.sensor)
 
 
-def get_device_after_msgs(id: str, msgs: dict) -> Device:
-    d = Device(MagicMock(), id)
+def test_stats():
+    d = get_device_after_msgs('test-device', {
+        '$name': 'Test Device',
+        '$nodes': '',
+        '$state': 'ready',
+        '$stats': 'uptime,signal,cputemp,custom',
+        '$stats/interval': '60',
+        '$stats/uptime': '468969',
+        '$stats/signal': '50',
+        '$stats/cputemp': '48.5',
+        '$stats/custom': 'something'
+    })
+    assert d.stats == {
+        'interval': 60,
+        'uptime': 468969,
+        'signal': 50,
+        'cputemp': 48.5,
+        'custom': 'something'
+    }
+    assert '$stats/uptime' not in d.attributes
+    assert d.attributes['$stats'] == 'uptime,signal,cputemp,custom'
+
+
+def test_invalid_stat():
+    d = get_device_after_msgs('test-device', {
+        '$stats/battery': 'unknown'
+    })
+    assert d.stats == {'battery': None}
+
+
+def test_stats_callback():
+    d = get_device_after_msgs('test-device', {
+        '$name': 'Test Device',
+        '$nodes': '',
+        '$state': 'ready',
+        '$stats/uptime': '42'
+    })
+    d._homie_client.on_device_updated.assert_called_with(d, '$stats/uptime', 42)
+
+
+def test_extensions():
+    d = get_device_after_msgs('test-device', {
+        '$extensions': 'org.homie.legacy-stats:0.1.1:[4.x],'
+                       'org.homie.legacy-firmware:0.1.1:[4.x;3.0.1]'
+    })
+    assert d.extensions == {
+        'org.homie.legacy-stats': {'version': '0.1.1', 'homie': ['4.x']},
+        'org.homie.legacy-firmware': {'version': '0.1.1', 'homie': ['4.x', '3.0.1']}
+    }
+
+
+def test_no_extensions():
+    d = get_device_after_msgs('test-device', {
+        '$extensions': ''
+    })
+    assert d.extensions == {}
+
+
+def test_lazy_node():
+    d = get_device_after_msgs('test-device', {
+        '$name': 'Test Device',
+        '$nodes': 'sensor',
+        '$state': 'ready',
+        'sensor/$name': 'Sensor',
+        'sensor/$type': 'unit-test-sensor',
+        'sensor/$properties': 'temperature',
+        'sensor/temperature/$name': 'Temperature',
+        'sensor/temperature/$datatype': 'float',
+        'sensor/temperature': '21.5'
+    }, lazy=True)
+    assert d.is_ready()
+    assert len(d._complete_nodes) == 0
+    d._homie_client.on_node_discovered.assert_not_called()
+
+    d.on_message('sensor/temperature', '22.5')
+    assert len(d._complete_nodes) == 0
+
+    assert d.sensor.temperature['value'] == 22.5
+    assert len(d._lazy_nodes) == 0
+    d._homie_client.on_node_discovered.assert_called_with(d.sensor)
+
+
+def test_lazy_node_registered_after_replay():
+    d = get_device_after_msgs('test-device', {
+        '$name': 'Test Device',
+        '$nodes': 'sensor',
+        '$state': 'ready',
+        'sensor/$name': 'Sensor',
+        'sensor/$type': 'unit-test-sensor',
+        'sensor/$properties': 'temperature',
+        'sensor/temperature/$name': 'Temperature',
+        'sensor/temperature/$datatype': 'float',
+        'sensor/temperature': '21.5'
+    }, lazy=True)
+    states = []
+    d._homie_client.on_property_updated.side_effect = lambda node, property, value: \
+        states.append(('sensor' in d._complete_nodes, 'sensor' in d._lazy_nodes))
+
+    d.sensor
+
+    assert states == [(False, True)]
+    d._homie_client._snapshot_property.assert_not_called()
+    d._homie_client._snapshot_node.assert_called_once_with(d.sensor)
+    assert 'sensor' in d._complete_nodes
+    assert 'sensor' not in d._lazy_nodes
+
+
+def test_lazy_node_materialized_concurrently():
+    d = get_device_after_msgs('test-device', {
+        '$name': 'Test Device',
+        '$nodes': 'sensor',
+        '$state': 'ready',
+        'sensor/$name': 'Sensor',
+        'sensor/$type': 'unit-test-sensor',
+        'sensor/$properties': 'temperature',
+        'sensor/temperature/$name': 'Temperature',
+        'sensor/temperature/$datatype': 'float',
+        'sensor/temperature': '21.5'
+    }, lazy=True)
+
+    class MaterializingDict(dict):
+        """Misses the node on the first lookup, and materializes it
+        right after, like a reader thread would."""
+        def lookup(self, key, default=None):
+            value = dict.get(self, key, default)
+            if key in d._lazy_nodes:
+                d._materialize_node(key)
+            return value
+
+        def get(self, key, default=None):
+            return self.lookup(key, default)
+
+        def __contains__(self, key):
+            return self.lookup(key) is not None
+
+    d._complete_nodes = MaterializingDict()
+    d.on_message('sensor/temperature', '22.5')
+    assert d.sensor.temperature['value'] == 22.5
+
+
+def test_lazy_node_list():
+    d = get_device_after_msgs('test-device', {
+        '$name': 'Test Device',
+        '$nodes': 'sensor',
+        '$state': 'ready',
+        'sensor/$name': 'Sensor',
+        'sensor/$type': 'unit-test-sensor',
+        'sensor/$properties': ''
+    }, lazy=True)
+    assert len(d._complete_nodes) == 0
+    assert d.nodes == [d.sensor]
+
+
+def test_lazy_node_wanted():
+    d = Device(MagicMock(), 'test-device', lazy=True)
+    d._homie_client._wants_node.return_value = True
+    for topic, msg in {
+        '$nodes': 'sensor',
+        'sensor/$name': 'Sensor',
+        'sensor/$type': 'unit-test-sensor',
+        'sensor/$properties': ''
+    }.items():
+        d.on_message(topic, msg)
+    assert len(d._complete_nodes) == 1
+    d._homie_client._wants_node.assert_called_with('test-device', 'sensor')
+
+
+def get_device_after_msgs(id: str, msgs: dict, lazy: bool = False) -> Device:
+    d = Device(MagicMock(), id, lazy=lazy)
+    d._homie_client._wants_node.return_value = False
     for topic, msg in msgs.items():
         d.on_message(topic, msg)
     return d
\ No newline at end of file
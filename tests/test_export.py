@@ -0,0 +1,176 @@
+import pytest
+import threading
+from unittest.mock import Mock
+
+from homieclient import ColumnarSink, ParquetWriter
+
+
+def test_row_group_size():
+    writer = Mock()
+    sink = ColumnarSink(writer, row_group_size=2)
+    node = get_node('sensor1', 'dht', {'temperature': 'float', 'humidity': 'float'})
+
+    sink.on_property_updated(node, 'temperature', {'value': 19.5})
+    sink.on_property_updated(node, 'humidity', {'value': 61.9})
+    sink.on_property_updated(node, 'temperature', {'value': 19.6})
+    sink.close()
+
+    assert writer.write_row_group.call_count == 2
+    (row_group, dictionaries) = writer.write_row_group.call_args_list[0][0]
+    assert row_group.device == [0, 0]
+    assert row_group.property == [0, 1]
+    assert row_group.float == [19.5, 61.9]
+    assert row_group.integer == [None, None]
+    assert dictionaries == {
+        'device': ['sensor1'],
+        'node': ['dht'],
+        'property': ['temperature', 'humidity']
+    }
+    writer.close.assert_called_once()
+
+
+def test_value_columns():
+    writer = Mock()
+    sink = ColumnarSink(writer)
+    node = get_node('device', 'node', {
+        'int': 'integer',
+        'bool': 'boolean',
+        'enum': 'enum'
+    })
+
+    sink.on_property_updated(node, 'int', {'value': 42})
+    sink.on_property_updated(node, 'bool', {'value': True})
+    sink.on_property_updated(node, 'enum', {'value': 'open'})
+    sink.close()
+
+    (row_group, _) = writer.write_row_group.call_args[0]
+    assert row_group.integer == [42, None, None]
+    assert row_group.boolean == [None, True, None]
+    assert row_group.string == [None, None, 'open']
+
+
+def test_flush_interval():
+    writer = Mock()
+    sink = ColumnarSink(writer, flush_interval=0.01)
+    node = get_node('device', 'node', {'prop': 'integer'})
+
+    sink.on_property_updated(node, 'prop', {'value': 1})
+    for _ in range(100):
+        if writer.write_row_group.called:
+            break
+        sink._thread.join(0.01)
+
+    assert writer.write_row_group.called
+    sink.close()
+
+
+def test_dropped_rows():
+    writing = threading.Event()
+    release = threading.Event()
+    writer = Mock()
+    writer.write_row_group.side_effect = lambda *args: writing.set() or release.wait()
+    sink = ColumnarSink(writer, row_group_size=1, max_pending=1)
+    node = get_node('device', 'node', {'prop': 'integer'})
+
+    sink.on_property_updated(node, 'prop', {'value': 1})
+    writing.wait()
+    sink.on_property_updated(node, 'prop', {'value': 2})
+    sink.on_property_updated(node, 'prop', {'value': 3})
+
+    assert sink.dropped_rows == 1
+    release.set()
+    sink.close()
+    assert writer.write_row_group.call_count == 2
+
+
+def test_close_waits_for_writer():
+    writing = threading.Event()
+    release = threading.Event()
+    writer = Mock()
+    writer.write_row_group.side_effect = lambda *args: writing.set() or release.wait()
+    sink = ColumnarSink(writer, max_pending=1)
+    node = get_node('device', 'node', {'prop': 'integer'})
+
+    sink.on_property_updated(node, 'prop', {'value': 1})
+    sink._flush()
+    writing.wait()
+    sink.on_property_updated(node, 'prop', {'value': 2})
+    sink._flush()
+    sink.on_property_updated(node, 'prop', {'value': 3})
+
+    closer = threading.Thread(target=sink.close)
+    closer.start()
+    closer.join(0.1)
+    assert closer.is_alive()
+    release.set()
+    closer.join()
+
+    assert sink.dropped_rows == 0
+    assert [c[0][0].integer for c in writer.write_row_group.call_args_list] == \
+        [[1], [2], [3]]
+    writer.close.assert_called_once()
+
+
+def test_update_during_and_after_close():
+    writing = threading.Event()
+    release = threading.Event()
+    writer = Mock()
+    writer.write_row_group.side_effect = lambda *args: writing.set() or release.wait()
+    sink = ColumnarSink(writer, max_pending=1)
+    node = get_node('device', 'node', {'prop': 'integer'})
+
+    sink.on_property_updated(node, 'prop', {'value': 1})
+    closer = threading.Thread(target=sink.close)
+    closer.start()
+    writing.wait()
+    sink.on_property_updated(node, 'prop', {'value': 2})
+    release.set()
+    closer.join()
+    sink.on_property_updated(node, 'prop', {'value': 3})
+    sink.close()
+
+    assert sink.dropped_rows == 2
+    assert [c[0][0].integer for c in writer.write_row_group.call_args_list] == [[1]]
+    writer.close.assert_called_once()
+
+
+def test_writer_error():
+    writer = Mock()
+    writer.write_row_group.side_effect = IOError('disk full')
+    sink = ColumnarSink(writer)
+    node = get_node('device', 'node', {'prop': 'integer'})
+
+    sink.on_property_updated(node, 'prop', {'value': 1})
+
+    with pytest.raises(IOError):
+        sink.close()
+
+
+def test_parquet(tmp_path):
+    pq = pytest.importorskip('pyarrow.parquet')
+    path = str(tmp_path / 'updates.parquet')
+    sink = ColumnarSink(ParquetWriter(path), row_group_size=2)
+    node = get_node('sensor1', 'dht', {'temperature': 'float', 'ok': 'boolean'})
+
+    sink.on_property_updated(node, 'temperature', {'value': 19.5})
+    sink.on_property_updated(node, 'ok', {'value': True})
+    sink.on_property_updated(node, 'temperature', {'value': 19.6})
+    sink.close()
+
+    f = pq.ParquetFile(path)
+    assert f.num_row_groups == 2
+    table = f.read().to_pydict()
+    assert table['device'] == ['sensor1'] * 3
+    assert table['property'] == ['temperature', 'ok', 'temperature']
+    assert table['float'] == [19.5, None, 19.6]
+    assert table['boolean'] == [None, True, None]
+
+
+def get_node(device_id: str, node_id: str, datatypes: dict) -> Mock:
+    node = Mock()
+    node.id = node_id
+    node.device.id = device_id
+    node._complete_properties = {
+        p: {'$datatype': datatype} for p, datatype in datatypes.items()
+    }
+    return node
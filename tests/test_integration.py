@@ -31,6 +31,7 @@ def test_integration():
 
     assert c.sensor1.state == 'ready'
     assert len(c.sensor1.nodes) == 2
+    assert c.sensor1.stats == {'interval': 65, 'signal': 50, 'uptime': 468969}
     assert len(c.sensor1.dht.properties) == 2
     assert len(c.sensor1.bmp.properties) == 1
     assert c.sensor1.dht.temperature == {'name': 'Temperature', 'unit': '°C', 'value': 19.82}
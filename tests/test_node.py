@@ -23,6 +23,8 @@ def test_properties_exist():
         ('boolean', 'true', True),
         ('boolean', 'false', False),
         ('boolean', 'invalid', None),
+        ('integer', '12.5', None),
+        ('float', 'invalid', None),
         ('string', 'something something', 'something something')
     ]
 )
@@ -91,6 +93,49 @@ def test_callback_on_out_of_order_init():
     })
 
 
+def test_stored_payload():
+    n = get_node_with_properties('test-node', {
+        'prop1': {'name': 'Property 1', 'datatype': 'integer'},
+        'prop2': {}
+    })
+    n.on_message('$attribute', 'some-value')
+    n.on_message('prop1', '123')
+    n.on_message('prop2/$name', 'Property 2')
+
+    assert n._stored_payload('$attribute') == 'some-value'
+    assert n._stored_payload('prop1') == '123'
+    assert n._stored_payload('prop1/$datatype') == 'integer'
+    assert n._stored_payload('prop2/$name') == 'Property 2'
+    assert n._stored_payload('prop3') is None
+    assert n._stored_payload('$properties') is None
+
+@pytest.mark.parametrize(
+    "value,payload",
+    [
+        (True, 'true'),
+        (False, 'false'),
+        (42, '42'),
+        ('open', 'open')
+    ]
+)
+def test_set(value, payload):
+    n = get_node_with_properties('test-node', {
+        'prop1': {'name': 'Property 1', 'datatype': 'string'}
+    })
+    n.device.id = 'test-device'
+
+    n.set('prop1', value)
+
+    n._homie_client.publish.assert_called_with(
+        'test-device/test-node/prop1/set', payload, qos=1)
+
+
+def test_set_unknown_property():
+    n = get_node_with_properties('test-node', {})
+
+    with pytest.raises(AttributeError):
+        n.set('prop1', 1)
+
 
 def get_node_with_properties(id: str, properties: dict) -> Node:
     homie_client = MagicMock()
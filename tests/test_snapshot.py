@@ -0,0 +1,229 @@
+import pytest
+
+from homieclient import HomieClient, Snapshot
+from homieclient.snapshot import PersistentMap
+from paho.mqtt.client import MQTTMessage
+
+
+DEVICE = {
+    'homie/sensor1/$homie': '3.0.1',
+    'homie/sensor1/$name': 'Sensor 1',
+    'homie/sensor1/$state': 'ready',
+    'homie/sensor1/$nodes': 'dht,bmp',
+    'homie/sensor1/$stats/uptime': '10',
+    'homie/sensor1/dht/$name': 'DHT22',
+    'homie/sensor1/dht/$type': 'sensor',
+    'homie/sensor1/dht/$properties': 'temperature',
+    'homie/sensor1/dht/temperature/$name': 'Temperature',
+    'homie/sensor1/dht/temperature/$datatype': 'float',
+    'homie/sensor1/dht/temperature/$unit': '°C',
+    'homie/sensor1/dht/temperature': '20.10',
+    'homie/sensor1/bmp/$name': 'BMP085',
+    'homie/sensor1/bmp/$type': 'sensor',
+    'homie/sensor1/bmp/$properties': 'pressure',
+    'homie/sensor1/bmp/pressure/$name': 'Pressure',
+    'homie/sensor1/bmp/pressure/$datatype': 'float',
+    'homie/sensor1/bmp/pressure': '1021.70'
+}
+
+
+def test_disabled():
+    c = HomieClient()
+    assert c.snapshot() is None
+
+
+def test_snapshot_contents():
+    c = get_client_with_messages(DEVICE)
+    s = c.snapshot()
+
+    assert len(s) == 1
+    assert 'sensor1' in s
+    assert s['sensor1'].attributes['$name'] == 'Sensor 1'
+    assert s['sensor1'].stats == {'uptime': 10}
+    assert s['sensor1'].nodes['dht'].attributes['$type'] == 'sensor'
+    assert s['sensor1'].nodes['dht'].properties['temperature'] == {
+        'name': 'Temperature', 'unit': '°C', 'value': 20.1}
+    assert [d.id for d in s] == ['sensor1']
+
+
+def test_property_metadata():
+    c = get_client_with_messages(DEVICE)
+
+    send_messages(c, {
+        'homie/sensor1/dht/temperature/$name': 'Air temperature',
+        'homie/sensor1/dht/temperature/$unit': '°F'
+    })
+
+    assert c.snapshot()['sensor1'].nodes['dht'].properties['temperature'] == {
+        'name': 'Air temperature', 'unit': '°F', 'value': 20.1}
+
+
+def test_node_bootstrap_single_update():
+    c = get_client_with_messages(DEVICE)
+    version = c.snapshot().version
+
+    send_messages(c, {
+        'homie/sensor1/$nodes': 'dht,bmp,light',
+        'homie/sensor1/light/p1/$name': 'P1',
+        'homie/sensor1/light/p1/$datatype': 'integer',
+        'homie/sensor1/light/p1': '1',
+        'homie/sensor1/light/p2/$name': 'P2',
+        'homie/sensor1/light/p2/$datatype': 'integer',
+        'homie/sensor1/light/p2': '2',
+        'homie/sensor1/light/$name': 'Light',
+        'homie/sensor1/light/$type': 'light',
+    })
+    assert c.snapshot().version == version
+    send_messages(c, {'homie/sensor1/light/$properties': 'p1,p2'})
+
+    assert c.snapshot().version == version + 1
+    assert c.snapshot()['sensor1'].nodes['light'].properties['p2']['value'] == 2
+
+
+def test_snapshot_immutable():
+    c = get_client_with_messages(DEVICE)
+    s = c.snapshot()
+    version = s.version
+
+    send_messages(c, {'homie/sensor1/dht/temperature': '21.00'})
+
+    assert s.version == version
+    assert s['sensor1'].nodes['dht'].properties['temperature']['value'] == 20.1
+    assert c.snapshot().version > version
+    assert c.snapshot()['sensor1'].nodes['dht'].properties['temperature']['value'] == 21.0
+    with pytest.raises(TypeError):
+        s['sensor1'].nodes['dht'].properties['temperature'] = None
+
+
+def test_invalid_value():
+    c = get_client_with_messages(DEVICE)
+
+    send_messages(c, {'homie/sensor1/dht/temperature': 'invalid'})
+
+    assert c.snapshot()['sensor1'].nodes['dht'].properties['temperature']['value'] is None
+
+
+def test_structural_sharing():
+    c = get_client_with_messages(DEVICE)
+    s1 = c.snapshot()
+
+    send_messages(c, {'homie/sensor1/dht/temperature': '21.00'})
+    s2 = c.snapshot()
+
+    assert s1['sensor1'].nodes['bmp'] is s2['sensor1'].nodes['bmp']
+    assert s1['sensor1'].attributes is s2['sensor1'].attributes
+
+
+def test_diff():
+    c = get_client_with_messages(DEVICE)
+    s1 = c.snapshot()
+
+    send_messages(c, {
+        'homie/sensor1/dht/temperature': '21.00',
+        'homie/sensor1/$state': 'lost',
+        'homie/sensor1/$stats/uptime': '70',
+        'homie/sensor1/bmp/$name': 'BMP180'
+    })
+    s2 = c.snapshot()
+
+    assert s1.diff(s2) == [
+        (('sensor1', '$state'), 'ready', 'lost'),
+        (('sensor1', '$stats/uptime'), 10, 70),
+        (('sensor1', 'dht', 'temperature'),
+            {'name': 'Temperature', 'unit': '°C', 'value': 20.1},
+            {'name': 'Temperature', 'unit': '°C', 'value': 21.0}),
+        (('sensor1', 'bmp', '$name'), 'BMP085', 'BMP180')
+    ]
+    assert s2.diff(s2) == []
+
+
+def test_diff_new_device():
+    s1 = Snapshot()
+    c = get_client_with_messages(DEVICE)
+    s2 = c.snapshot()
+
+    assert s1.diff(s2) == [(('sensor1',), None, s2['sensor1'])]
+    assert s2.diff(s1) == [(('sensor1',), s2['sensor1'], None)]
+
+
+def test_lazy_node():
+    c = get_client_with_messages(DEVICE, lazy=True)
+    assert len(c.snapshot()['sensor1'].nodes) == 0
+
+    c.sensor1.dht
+    assert list(c.snapshot()['sensor1'].nodes.keys()) == ['dht']
+
+
+def test_persistent_map():
+    m1 = PersistentMap({'a': 1})
+    m2 = m1.set('b', 2)
+    m3 = m2.set('a', 3)
+
+    assert dict(m1) == {'a': 1}
+    assert dict(m2) == {'a': 1, 'b': 2}
+    assert dict(m3) == {'a': 3, 'b': 2}
+    assert len(m3) == 2
+    assert 'c' not in m3
+    with pytest.raises(KeyError):
+        m3['c']
+
+
+def test_persistent_map_many_keys():
+    m = PersistentMap()
+    for i in range(5000):
+        m = m.set(f'device{i}', i)
+    m = m.set('device42', -1)
+
+    assert len(m) == 5000
+    assert m['device42'] == -1
+    assert m['device4999'] == 4999
+    assert sorted(m.values())[:2] == [-1, 0]
+
+
+def test_persistent_map_collisions():
+    keys = [Colliding(i) for i in range(3)]
+    m = PersistentMap()
+    for k in keys:
+        m = m.set(k, k.id)
+    m = m.set(keys[1], 10)
+    m = m.set('other', 20)
+
+    assert len(m) == 4
+    assert [m[k] for k in keys] == [0, 10, 2]
+    assert m['other'] == 20
+    with pytest.raises(KeyError):
+        m[Colliding(3)]
+
+
+def test_persistent_map_changed_keys():
+    m1 = PersistentMap((f'device{i}', i) for i in range(1000))
+    m2 = m1.set('device1', -1).set('new', 0)
+
+    assert set(['device1', 'new']) <= set(m1.changed_keys(m2))
+    assert len(m1.changed_keys(m2)) < 10
+    assert m1.changed_keys(m1) == []
+
+
+def get_client_with_messages(msgs: dict, lazy: bool = False) -> HomieClient:
+    c = HomieClient(snapshots=True, lazy=lazy)
+    send_messages(c, msgs)
+    return c
+
+
+def send_messages(c: HomieClient, msgs: dict):
+    for topic, payload in msgs.items():
+        msg = MQTTMessage()
+        msg.topic = topic.encode('utf-8')
+        msg.payload = payload.encode('utf-8')
+        c.on_message(None, None, msg)
+
+
+class Colliding:
+    def __init__(self, id):
+        self.id = id
+
+    def __hash__(self):
+        return 42
+
+    def __eq__(self, other):
+        return isinstance(other, Colliding) and other.id == self.id
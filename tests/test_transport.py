@@ -0,0 +1,239 @@
+import pytest
+from unittest.mock import Mock
+
+from homieclient import HomieClient, MemoryBroker, MemoryTransport
+from homieclient.transport import topic_matches
+
+
+DEVICE = [
+    ('$homie', '3.0.1'),
+    ('$name', 'Test device'),
+    ('$state', 'ready'),
+    ('$nodes', 'testnode'),
+    ('testnode/$name', 'Test node'),
+    ('testnode/$type', 'test'),
+    ('testnode/$properties', 'prop,switch'),
+    ('testnode/prop/$name', 'Property'),
+    ('testnode/prop/$datatype', 'integer'),
+    ('testnode/prop', '1'),
+    ('testnode/switch/$name', 'Switch'),
+    ('testnode/switch/$datatype', 'boolean'),
+    ('testnode/switch/$settable', 'true'),
+    ('testnode/switch', 'false')
+]
+
+
+@pytest.mark.parametrize(
+    "topic_filter,topic,expected",
+    [
+        ('homie/#', 'homie/device/$name', True),
+        ('homie/#', 'other/device/$name', False),
+        ('homie/+/$name', 'homie/device/$name', True),
+        ('homie/+/$name', 'homie/device/node/$name', False),
+        ('homie/device', 'homie/device', True),
+        ('homie/device/+', 'homie/device', False),
+        ('homie/device/#', 'homie/device/node', True)
+    ]
+)
+def test_topic_matches(topic_filter, topic, expected):
+    assert topic_matches(topic_filter, topic) == expected
+
+
+def test_retained_replay():
+    broker = MemoryBroker()
+    broker.publish('homie/a', 'retained', retain=True)
+    broker.publish('homie/b', 'not retained')
+    channel = MemoryTransport(broker).attach(on_message=Mock())
+    channel.connect()
+
+    channel.subscribe('homie/#')
+    channel.on_message.assert_called_once()
+    msg = channel.on_message.call_args[0][2]
+    assert (msg.topic, msg.payload, msg.retain) == ('homie/a', b'retained', True)
+
+    broker.publish('homie/b', 'live', retain=True)
+    msg = channel.on_message.call_args[0][2]
+    assert (msg.topic, msg.payload, msg.retain) == ('homie/b', b'live', False)
+
+
+def test_clear_retained():
+    broker = MemoryBroker()
+    broker.publish('homie/a', 'retained', retain=True)
+    broker.publish('homie/a', '', retain=True)
+    assert broker.retained == {}
+
+
+def test_disconnect():
+    broker = MemoryBroker()
+    transport = MemoryTransport(broker)
+    channel = transport.attach(on_disconnect=Mock(), on_message=Mock())
+    channel.connect()
+    channel.subscribe('homie/#')
+
+    transport.disconnect(1)
+    broker.publish('homie/a', 'payload')
+
+    channel.on_disconnect.assert_called_with(channel, None, 1)
+    channel.on_message.assert_not_called()
+
+
+def test_client():
+    broker = MemoryBroker()
+    publish_device(broker, 'testdevice')
+    c = HomieClient(transport=MemoryTransport(broker))
+    c.on_property_updated = Mock()
+    c.connect()
+
+    assert c.testdevice.testnode.prop['value'] == 1
+
+    broker.publish('homie/testdevice/testnode/prop', '2', retain=True)
+    c.on_property_updated.assert_called_with(c.testdevice.testnode, 'prop', {
+        'name': 'Property', 'unit': None, 'value': 2})
+
+
+def test_selective_subscription():
+    broker = MemoryBroker()
+    publish_device(broker, 'device1')
+    publish_device(broker, 'device2')
+    c = HomieClient(devices=['device2'], transport=MemoryTransport(broker))
+    c.on_broadcast = Mock()
+    c.connect()
+    broker.publish('homie/$broadcast/alert', 'test')
+
+    assert [d.id for d in c.devices] == ['device2']
+    c.on_broadcast.assert_called_with('alert', 'test')
+
+
+def test_set_property():
+    broker = MemoryBroker()
+    publish_device(broker, 'testdevice')
+    c = HomieClient(transport=MemoryTransport(broker))
+    c.connect()
+    listener = MemoryTransport(broker).attach(on_message=Mock())
+    listener.connect()
+    listener.subscribe('homie/+/+/+/set')
+
+    c.testdevice.testnode.set('switch', True)
+
+    msg = listener.on_message.call_args[0][2]
+    assert (msg.topic, msg.payload, msg.qos, msg.retain) == \
+        ('homie/testdevice/testnode/switch/set', b'true', 1, False)
+
+
+def test_shared_transport():
+    broker = MemoryBroker()
+    publish_device(broker, 'device1')
+    publish_device(broker, 'device2')
+    transport = MemoryTransport(broker)
+    c1 = HomieClient(devices=['device1'], transport=transport)
+    c2 = HomieClient(devices=['device2'], transport=transport)
+    c1.on_property_updated = Mock()
+    c2.on_property_updated = Mock()
+    c1.connect()
+    c2.connect()
+
+    assert [d.id for d in c1.devices] == ['device1']
+    assert [d.id for d in c2.devices] == ['device2']
+
+    c1.on_property_updated.reset_mock()
+    broker.publish('homie/device2/testnode/prop', '2', retain=True)
+    c1.on_property_updated.assert_not_called()
+    c2.on_property_updated.assert_called_with(c2.device2.testnode, 'prop', {
+        'name': 'Property', 'unit': None, 'value': 2})
+
+
+def test_shared_transport_disconnect():
+    broker = MemoryBroker()
+    publish_device(broker, 'testdevice')
+    transport = MemoryTransport(broker)
+    c1 = HomieClient(transport=transport)
+    c2 = HomieClient(transport=transport)
+    c1.on_disconnected = Mock()
+    c2.on_disconnected = Mock()
+    c1.connect()
+    c2.connect()
+    c2.on_property_updated = Mock()
+
+    c1.disconnect()
+    broker.publish('homie/testdevice/testnode/prop', '2', retain=True)
+
+    c1.on_disconnected.assert_called_with(0)
+    c2.on_disconnected.assert_not_called()
+    assert transport.connected
+    c2.on_property_updated.assert_called_once()
+
+    c2.disconnect()
+    assert not transport.connected
+
+
+def test_shared_transport_unsubscribe():
+    broker = MemoryBroker()
+    transport = MemoryTransport(broker)
+    c1 = HomieClient(devices=['device1'], transport=transport)
+    c2 = HomieClient(devices=['device2'], transport=transport)
+    c1.connect()
+    c2.connect()
+
+    c2.disconnect()
+    publish_device(broker, 'device1')
+    publish_device(broker, 'device2')
+
+    assert [d.id for d in c1.devices] == ['device1']
+    assert [s[0] for s in broker._subscriptions] == \
+        ['homie/device1/#', 'homie/$broadcast/#']
+
+
+def test_shared_transport_late_client():
+    broker = MemoryBroker()
+    publish_device(broker, 'testdevice')
+    transport = MemoryTransport(broker)
+    c1 = HomieClient(transport=transport)
+    c1.connect()
+    c1.on_property_updated = Mock()
+    c2 = HomieClient(transport=transport)
+    c2.on_property_updated = Mock()
+    c2.connect()
+
+    c1.on_property_updated.assert_not_called()
+    assert c2.on_property_updated.call_count == 2
+
+
+def test_reconnect():
+    broker = MemoryBroker()
+    publish_device(broker, 'testdevice')
+    broker.publish('homie/testdevice/$stats/uptime', '120', retain=True)
+    broker.publish('homie/testdevice/$stats/signal', '80', retain=True)
+    transport = MemoryTransport(broker)
+    c = HomieClient(transport=transport, snapshots=True)
+    c.connect()
+    c.on_property_updated = Mock()
+    c.on_device_updated = Mock()
+    snapshot = c.snapshot()
+
+    transport.disconnect(1)
+    c.connect()
+
+    c.on_property_updated.assert_not_called()
+    c.on_device_updated.assert_not_called()
+    assert c.snapshot() is snapshot
+    # $nodes and $properties are not stored as is, and are processed again
+    assert c.resync_stats['suppressed'] == len(broker.retained) - 2
+
+
+def test_many_devices():
+    broker = MemoryBroker()
+    c = HomieClient(transport=MemoryTransport(broker))
+    c.connect()
+    for i in range(100):
+        publish_device(broker, f'device{i}')
+    for i in range(100):
+        for value in range(100):
+            broker.publish(f'homie/device{i}/testnode/prop', str(value), retain=True)
+
+    assert len(c.devices) == 100
+    assert all(d.testnode.prop['value'] == 99 for d in c.devices)
+
+
+def publish_device(broker: MemoryBroker, id: str):
+    for topic, payload in DEVICE:
+        broker.publish(f'homie/{id}/{topic}', payload, retain=True)